@@ -0,0 +1,172 @@
+"""
+Local stand-ins for the IGN WMTS and ALTI services and for Overpass, served by an in-process HTTP server.
+
+    with FakeServices(latency=0.05) as services:
+        ...  # ign.api and overpass.api now query http://127.0.0.1:<port>/
+
+Responses have the same format as the real services: JPEG tiles, `{"elevations": [...]}` documents and OSM XML nodes.
+While active, tiles and elevations are cached in a temporary directory, so that runs start cold and never touch the
+user's caches.
+"""
+import io
+import json
+import math
+import shutil
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+PLACE_SPACING = 0.1  # degrees between two fake places
+PLACE_TYPES = ["village", "village", "town", "village", "city"]
+
+
+def fake_elevation(lon, lat):
+    """Smooth synthetic terrain, in meters"""
+    return 600 + 400 * math.sin(lon * 7.) * math.cos(lat * 5.) + 50 * math.sin(lon * 90.) * math.sin(lat * 70.)
+
+
+def fake_places(w, s, e, n, types):
+    """Places on a regular grid of `PLACE_SPACING` degrees, as OSM XML"""
+    nodes = []
+    for i in range(math.ceil(w / PLACE_SPACING), math.floor(e / PLACE_SPACING) + 1):
+        for j in range(math.ceil(s / PLACE_SPACING), math.floor(n / PLACE_SPACING) + 1):
+            place = PLACE_TYPES[(i * 7 + j * 3) % len(PLACE_TYPES)]
+            if place not in types:
+                continue
+            tags = {
+                "name": "Lieu {}-{}".format(i, j),
+                "place": place,
+                "population": str(100 * (1 + (i * 13 + j * 17) % 500)),
+                "ref:INSEE": "{:05d}".format((i * 31 + j) % 95000 + 1000)
+            }
+            nodes.append('<node id="{}" lat="{:.7f}" lon="{:.7f}">{}</node>'.format(
+                len(nodes) + 1, j * PLACE_SPACING, i * PLACE_SPACING,
+                "".join('<tag k="{}" v="{}"/>'.format(k, v) for k, v in tags.items())
+            ))
+    return '<?xml version="1.0" encoding="UTF-8"?><osm version="0.6">{}</osm>'.format("".join(nodes)).encode("utf-8")
+
+
+def fake_tile(size=256):
+    from PIL import Image, ImageDraw
+    im = Image.new("RGB", (size, size), (236, 232, 220))
+    draw = ImageDraw.Draw(im)
+    for k in range(0, size, 32):
+        draw.line([(k, 0), (k, size)], fill=(200, 200, 190))
+        draw.line([(0, k), (size, k)], fill=(200, 200, 190))
+    buffer = io.BytesIO()
+    im.save(buffer, format="JPEG", quality=85)
+    return buffer.getvalue()
+
+
+class Handler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def send(self, status, content, content_type):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def do_GET(self):
+        time.sleep(self.server.latency)
+        self.server.count(self.path)
+        parts = urlsplit(self.path)
+        if parts.path.endswith("/wmts"):
+            params = {k.upper(): v[0] for k, v in parse_qs(parts.query).items()}
+            if params.get("REQUEST") != "GetTile":
+                return self.send(400, b"Unsupported request", "text/plain")
+            return self.send(200, self.server.tile, "image/jpeg")
+        if parts.path.endswith("/elevation.json"):
+            params = parse_qs(parts.query)
+            lon = [float(v) for v in params["lon"][0].split("|")]
+            lat = [float(v) for v in params["lat"][0].split("|")]
+            data = {"elevations": [round(fake_elevation(x, y), 2) for x, y in zip(lon, lat)]}
+            return self.send(200, json.dumps(data).encode("utf-8"), "application/json")
+        if parts.path.endswith("/xapi"):
+            query = unquote(parts.query)
+            bbox = query[query.index("bbox=") + 5:].split("]")[0]
+            w, s, e, n = [float(v) for v in bbox.split(",")]
+            types = query[query.index("place=") + 6:].split("]")[0].split("|")
+            return self.send(200, fake_places(w, s, e, n, types), "application/xml")
+        self.send(404, b"Not found", "text/plain")
+
+
+class FakeServices:
+    """Serve fake tiles, elevations and places on localhost, and point `ign.api` and `overpass.api` to them"""
+    def __init__(self, latency=0.):
+        self.latency = latency
+        self.server = None
+        self.dir = None
+        self._saved = None
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:{}".format(self.server.server_port)
+
+    @property
+    def requests(self):
+        """Number of requests received, by service"""
+        return dict(self.server.requests)
+
+    def reset_caches(self):
+        """Start again with empty tile and elevation caches"""
+        import ign.api
+        from ign.cache import TileCache
+        from ign.elevation import ElevationCache, ElevationClient
+        if self.dir is not None:
+            ign.api.elevation_source.cache.close()
+            shutil.rmtree(self.dir, ignore_errors=True)
+        self.dir = tempfile.mkdtemp(prefix="itinerator-bench-")
+        ign.api.tile_cache = TileCache(root=self.dir + "/tiles")
+        cache = ElevationCache(self.dir + "/elevations.sqlite")
+        ign.api.elevation_source = ElevationClient(ign.api.alti_query, cache=cache)
+
+    def __enter__(self):
+        import ign.api
+        import overpass.api
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.server.latency = self.latency
+        self.server.tile = fake_tile()
+        self.server.requests = {}
+        lock = threading.Lock()
+
+        def count(path):
+            service = urlsplit(path).path.rsplit("/", 1)[-1]
+            with lock:
+                self.server.requests[service] = self.server.requests.get(service, 0) + 1
+        self.server.count = count
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+        self._saved = {
+            "api": ign.api.API,
+            "alti": ign.api.ALTI_API,
+            "overpass": overpass.api.OVERPASS_ENDPOINT,
+            "tile_cache": ign.api.tile_cache,
+            "elevation_source": ign.api.elevation_source
+        }
+        ign.api.API = self.url + "/geoportail/wmts?"
+        ign.api.ALTI_API = self.url + "/alti/rest/"
+        overpass.api.OVERPASS_ENDPOINT = self.url + "/api/xapi?node[bbox={w:.4f},{s:.4f},{e:.4f},{n:.4f}][place={place}]"
+        self.reset_caches()
+        return self
+
+    def __exit__(self, *exc):
+        import ign.api
+        import overpass.api
+        ign.api.elevation_source.cache.close()
+        ign.api.API = self._saved["api"]
+        ign.api.ALTI_API = self._saved["alti"]
+        overpass.api.OVERPASS_ENDPOINT = self._saved["overpass"]
+        ign.api.tile_cache = self._saved["tile_cache"]
+        ign.api.elevation_source = self._saved["elevation_source"]
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.dir, ignore_errors=True)
+        self.dir = None
+        return False
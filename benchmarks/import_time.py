@@ -0,0 +1,62 @@
+"""
+Import-time guard: each stage must import within its time budget and without loading the heavy dependencies it
+doesn't need. Every check runs in a fresh interpreter.
+
+    python benchmarks/import_time.py [--repeat 5]
+
+Exits with a non-zero status if any budget is exceeded.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY = ["matplotlib", "PIL", "requests", "owslib", "fastkml", "shapely", "geopy", "pyproj"]
+
+# (statement, budget in seconds, heavy modules allowed)
+STAGES = [
+    ("import main", 0.3, []),
+    ("import utils.kml", 0.3, []),
+    ("import track.track", 0.4, []),
+    ("import ign.api", 0.6, ["requests"]),
+]
+
+PROBE = """
+import json, sys, time
+t = time.perf_counter()
+{stmt}
+elapsed = time.perf_counter() - t
+print(json.dumps({{"elapsed": elapsed, "loaded": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def measure(stmt, repeat):
+    results = []
+    for _ in range(repeat):
+        out = subprocess.check_output([sys.executable, "-c", PROBE.format(stmt=stmt, heavy=HEAVY)], cwd=ROOT)
+        results.append(json.loads(out.decode("utf-8").strip().splitlines()[-1]))
+    return min(r["elapsed"] for r in results), results[0]["loaded"]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5, help="runs per stage, the best one is kept")
+    args = parser.parse_args(argv)
+
+    failed = False
+    for stmt, budget, allowed in STAGES:
+        elapsed, loaded = measure(stmt, args.repeat)
+        unexpected = [m for m in loaded if m not in allowed]
+        ok = elapsed <= budget and not unexpected
+        failed = failed or not ok
+        print("{:<6} {:<22} {:6.3f}s / {:.2f}s{}".format(
+            "ok" if ok else "FAIL", stmt, elapsed, budget,
+            "  unexpected: " + ", ".join(unexpected) if unexpected else ""))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,215 @@
+"""
+Offline throughput benchmarks of the whole pipeline, on synthetic tracks and against local fake services (see
+`fake_services.py`), so that runs don't depend on the network nor on the live IGN and Overpass services.
+
+    python benchmarks/run.py                                   # 1k, 10k, 100k & 1M points
+    python benchmarks/run.py --sizes 1000 10000 --latency 0.05 # simulate 50 ms of network latency
+    python benchmarks/run.py --label before-fix                # store as benchmarks/results/before-fix.json
+
+Stages, in pipeline order: read_track (GPX parsing), decimate, segmentize (including decimation), distance (the
+cumulated distances sliced by every segment in `process`), process (profiles & cities) and load (rendering, only for
+tracks of at most --max-load-points points). Each stage keeps its best time out of --repeat runs.
+
+Results are stored in benchmarks/results/<label>.json (the label defaults to the current commit), and compared with
+the previous results file, or with --compare. Exits with a non-zero status if a stage got slower than --threshold times
+its previous time.
+"""
+import argparse
+import datetime
+import glob
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import numpy as np
+
+import format
+import geo
+import ign
+from fake_services import FakeServices
+from synthetic import make_path, write_gpx
+from track.segment import TrackSegment
+from track.track import Track
+from utils import kml
+
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+SIZES = [1000, 10000, 100000, 1000000]
+STAGES = ["read_track", "decimate", "segmentize", "distance", "process", "load"]
+
+
+def fresh(path):
+    """Copy of `path` without any cached projection or distance"""
+    return geo.TrackPath(path.lon, path.lat, alt=path.alt)
+
+
+def run_stage(stage, ctx, args, services):
+    """Run `stage` once and return its duration, in seconds. Stages store their output in `ctx` for the next ones"""
+    if stage == "read_track":
+        start = time.perf_counter()
+        ctx["raw"], _ = kml.read_track(ctx["gpx"])
+        return time.perf_counter() - start
+
+    if stage == "decimate":
+        path = fresh(ctx["raw"])
+        start = time.perf_counter()
+        if args.tolerance > 0:
+            path = path.decimate(args.tolerance * ign.levels[args.zoom].res)
+        ctx["kept"] = len(path)
+        return time.perf_counter() - start
+
+    if stage == "segmentize":
+        start = time.perf_counter()
+        track = Track.from_path(fresh(ctx["raw"]), format=format.A4, zoom=args.zoom, process=False,
+                                tolerance=args.tolerance)
+        elapsed = time.perf_counter() - start
+        ctx["segments"] = len(track)
+        ctx["segmented"] = track
+        return elapsed
+
+    if stage == "distance":
+        track = ctx["segmented"]
+        start = time.perf_counter()
+        TrackSegment.distances(*track.path.at_index(track.sample_points()))
+        return time.perf_counter() - start
+
+    if stage == "process":
+        services.reset_caches()
+        track = Track.from_path(ctx["raw"], format=format.A4, zoom=args.zoom, process=False, tolerance=args.tolerance)
+        start = time.perf_counter()
+        track.process()
+        elapsed = time.perf_counter() - start
+        ctx["track"] = track
+        return elapsed
+
+    if stage == "load":
+        services.reset_caches()
+        dir = tempfile.mkdtemp(prefix="itinerator-pages-")
+        try:
+            start = time.perf_counter()
+            ctx["track"].load(dir=dir + "/", dpi=args.dpi, workers=args.workers, force=True)
+            return time.perf_counter() - start
+        finally:
+            shutil.rmtree(dir, ignore_errors=True)
+
+    raise ValueError("Unknown stage '{}'".format(stage))
+
+
+def bench_size(n, args, services, tmp):
+    gpx = os.path.join(tmp, "track-{}.gpx".format(n))
+    write_gpx(make_path(n, seed=args.seed), gpx)
+    ctx = {"gpx": gpx}
+    results = {}
+    for stage in STAGES:
+        if stage == "load" and n > args.max_load_points:
+            continue
+        times = []
+        try:
+            for _ in range(args.repeat):
+                times.append(run_stage(stage, ctx, args, services))
+        except Exception as e:
+            results[stage] = {"error": "{}: {}".format(type(e).__name__, e)}
+            print("{:>9,} {:<13} failed ({})".format(n, stage, results[stage]["error"]))
+            if stage in ("read_track", "segmentize", "process"):
+                break  # later stages depend on it
+            continue
+        best = min(times)
+        results[stage] = {"seconds": best, "points_per_s": n / best if best > 0 else None}
+        if stage == "segmentize":
+            results[stage]["segments"] = ctx["segments"]
+        if stage == "decimate":
+            results[stage]["kept"] = ctx["kept"]
+        print("{:>9,} {:<13} {:9.4f}s {:>14,.0f} points/s".format(n, stage, best, results[stage]["points_per_s"] or 0))
+    os.remove(gpx)
+    return results
+
+
+def git_label():
+    try:
+        label = subprocess.check_output(["git", "describe", "--always", "--dirty"], cwd=ROOT, stderr=subprocess.DEVNULL)
+        return label.decode("utf-8").strip()
+    except (OSError, subprocess.CalledProcessError):
+        return datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+
+
+def previous_results(exclude):
+    files = [f for f in glob.glob(os.path.join(RESULTS_DIR, "*.json")) if os.path.abspath(f) != os.path.abspath(exclude)]
+    return max(files, key=os.path.getmtime) if files else None
+
+
+def compare(results, baseline, threshold):
+    """Print the time ratio of every stage measured in both runs, and return the list of regressions"""
+    regressions = []
+    print("\nCompared with {} ({})".format(baseline["label"], baseline["date"]))
+    for size, stages in results["sizes"].items():
+        for stage, r in stages.items():
+            before = baseline["sizes"].get(size, {}).get(stage, {})
+            if "seconds" not in r or "seconds" not in before:
+                continue
+            ratio = r["seconds"] / before["seconds"] if before["seconds"] > 0 else float("inf")
+            slower = ratio > threshold
+            if slower:
+                regressions.append((size, stage, ratio))
+            print("{:>9} {:<13} {:9.4f}s -> {:9.4f}s  x{:.2f}{}".format(
+                size, stage, before["seconds"], r["seconds"], ratio, "  SLOWER" if slower else ""))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES, help="track lengths, in points")
+    parser.add_argument("--latency", type=float, default=0., help="delay added to every fake response, in seconds")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per stage, the best one is kept")
+    parser.add_argument("--zoom", type=int, default=ign.zoom.DEFAULT)
+    parser.add_argument("--tolerance", type=float, default=0.5, help="decimation tolerance in pixels, 0 to disable")
+    parser.add_argument("--dpi", type=int, default=72)
+    parser.add_argument("--workers", type=int, default=1, help="rendering processes")
+    parser.add_argument("--max-load-points", type=int, default=100000, help="only render tracks up to this size")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--label", default=None, help="name of the results file (default: current commit)")
+    parser.add_argument("--compare", default=None, help="results file to compare with (default: the previous one)")
+    parser.add_argument("--threshold", type=float, default=1.25, help="slowdown ratio reported as a regression")
+    args = parser.parse_args(argv)
+
+    label = args.label or git_label()
+    results = {
+        "label": label,
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "args": vars(args),
+        "sizes": {}
+    }
+    tmp = tempfile.mkdtemp(prefix="itinerator-bench-")
+    try:
+        with FakeServices(latency=args.latency) as services:
+            for n in args.sizes:
+                results["sizes"][str(n)] = bench_size(n, args, services, tmp)
+            results["requests"] = services.requests
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    fname = os.path.join(RESULTS_DIR, label + ".json")
+    baseline = args.compare or previous_results(exclude=fname)
+    with open(fname, "wt", encoding="utf-8") as f:
+        json.dump(results, f, indent=1)
+    print("\nResults saved to", fname)
+
+    if baseline is None:
+        return 0
+    with open(baseline, "rt", encoding="utf-8") as f:
+        regressions = compare(results, json.load(f), args.threshold)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
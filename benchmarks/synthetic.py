@@ -0,0 +1,36 @@
+"""
+Synthetic GPS tracks: a walker recording one fix per second, with a slowly drifting heading and some GPS noise.
+"""
+import numpy as np
+
+import geo
+
+STEP = 1.4e-5  # degrees between two fixes, about 1.4 m/s
+NOISE = 2e-6  # degrees, about 20 cm
+
+
+def make_path(n, seed=0, start=(2.35, 45.0), step=STEP, noise=NOISE):
+    """Random walk of `n` points from `start` (lon, lat), as a `geo.TrackPath` with altitudes and timestamps"""
+    rng = np.random.RandomState(seed)
+    heading = np.cumsum(rng.normal(0, 0.05, n)) + rng.uniform(0, 2 * np.pi)
+    lon = start[0] + np.cumsum(np.cos(heading) * step) + rng.normal(0, noise, n)
+    lat = start[1] + np.cumsum(np.sin(heading) * step) + rng.normal(0, noise, n)
+    alt = 500 + np.cumsum(rng.normal(0, 0.2, n))
+    return geo.TrackPath(lon, lat, alt=alt, time=np.arange(n, dtype=np.float64))
+
+
+def write_gpx(path, fname, name="Synthetic track"):
+    """Write `path` as a single GPX track"""
+    with open(fname, "wt", encoding="utf-8") as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+        f.write('<gpx version="1.1" creator="itinerator-benchmarks" xmlns="http://www.topografix.com/GPX/1/1">\n')
+        f.write("<trk><name>{}</name><trkseg>\n".format(name))
+        chunk = 100000
+        for i in range(0, len(path), chunk):
+            f.write("".join(
+                '<trkpt lat="{:.7f}" lon="{:.7f}"><ele>{:.1f}</ele></trkpt>\n'.format(lat, lon, alt)
+                for lon, lat, alt in zip(
+                    path.lon[i:i + chunk].tolist(), path.lat[i:i + chunk].tolist(), path.alt[i:i + chunk].tolist()
+                )
+            ))
+        f.write("</trkseg></trk>\n</gpx>\n")
@@ -1,3 +1,7 @@
 from .bbox import Bbox
 from .point import Point
-import geo.utils as utils
\ No newline at end of file
+from .path import TrackPath
+import geo.utils as utils
+import geo.distance as distance
+import geo.segmentation as segmentation
+import geo.polyline as polyline
\ No newline at end of file
@@ -0,0 +1,64 @@
+"""
+Vectorized distance kernels, in kilometers.
+
+Two models are available, for distances between successive GPS fixes:
+- "haversine": great circle on a sphere of radius `MEAN_RADIUS`. Fastest, but up to 0.56% off the WGS84 geodesic
+  (geopy's `distance`), depending on latitude and heading.
+- "ellipsoid": local flat approximation on the WGS84 ellipsoid, using the meridional and prime vertical radii of
+  curvature at the mid-latitude. For steps shorter than 10 km, the relative error against geopy is below 1e-6 between
+  70°S and 70°N, and grows towards the poles: up to 3.2e-6 at 80° and 1.3e-5 at 85°.
+"""
+import numpy as np
+
+MEAN_RADIUS = 6371.0088  # km
+WGS84_A = 6378.137  # km
+WGS84_F = 1 / 298.257223563
+WGS84_E2 = WGS84_F * (2 - WGS84_F)
+
+HAVERSINE = "haversine"
+ELLIPSOID = "ellipsoid"
+DEFAULT_MODEL = ELLIPSOID
+
+
+def haversine(lon1, lat1, lon2, lat2):
+    lon1, lat1, lon2, lat2 = map(np.radians, (lon1, lat1, lon2, lat2))
+    dlon = lon2 - lon1
+    dlat = lat2 - lat1
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+    return 2 * MEAN_RADIUS * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def ellipsoid(lon1, lat1, lon2, lat2):
+    lon1, lat1, lon2, lat2 = map(np.radians, (lon1, lat1, lon2, lat2))
+    dlon = (lon2 - lon1 + np.pi) % (2 * np.pi) - np.pi
+    dlat = lat2 - lat1
+    sin_phi = np.sin(0.5 * (lat1 + lat2))
+    w = 1 - WGS84_E2 * sin_phi ** 2
+    m = WGS84_A * (1 - WGS84_E2) / (w * np.sqrt(w))  # meridional radius
+    n = WGS84_A / np.sqrt(w)  # prime vertical radius
+    dx = n * np.cos(0.5 * (lat1 + lat2)) * dlon
+    dy = m * dlat
+    return np.hypot(dx, dy)
+
+
+MODELS = {
+    HAVERSINE: haversine,
+    ELLIPSOID: ellipsoid
+}
+
+
+def steps(lon, lat, model=DEFAULT_MODEL):
+    """Distance between each pair of successive points: an array of length `len(lon) - 1`"""
+    if model not in MODELS:
+        raise ValueError("Unknown distance model '{}'. Must be one of {}".format(model, list(MODELS)))
+    lon = np.asarray(lon, dtype=np.float64)
+    lat = np.asarray(lat, dtype=np.float64)
+    return MODELS[model](lon[:-1], lat[:-1], lon[1:], lat[1:])
+
+
+def cumulative(lon, lat, model=DEFAULT_MODEL):
+    """Cumulated distance from the first point: an array of length `len(lon)`, starting at 0"""
+    cumdist = np.zeros(len(lon), dtype=np.float64)
+    if len(lon) > 1:
+        np.cumsum(steps(lon, lat, model), out=cumdist[1:])
+    return cumdist
@@ -0,0 +1,139 @@
+import numpy as np
+
+import geo.polyline
+import geo.utils
+from geo.point import Point
+from geo.bbox import Bbox
+
+
+class TrackPath:
+    """
+    Sequence of GPS fixes stored as contiguous float64 arrays.
+
+    Behaves like a list of `Point`: `path[i]` builds a `Point` on the fly, while slices return a new `TrackPath` sharing
+    the same memory. Vectorized code should read `lon`, `lat` (and optionally `alt` and `time`) directly.
+
+    A path returned by `decimate` keeps, in `index`, the position of each of its points in the original path.
+    """
+    def __init__(self, lon, lat, alt=None, time=None):
+        self.lon = np.ascontiguousarray(lon, dtype=np.float64)
+        self.lat = np.ascontiguousarray(lat, dtype=np.float64)
+        if self.lon.shape != self.lat.shape or self.lon.ndim != 1:
+            raise ValueError("'lon' and 'lat' must be 1-D arrays of the same length")
+        self.alt = None if alt is None else np.ascontiguousarray(alt, dtype=np.float64)
+        self.time = None if time is None else np.ascontiguousarray(time, dtype=np.float64)
+        for name in ["alt", "time"]:
+            values = getattr(self, name)
+            if values is not None and values.shape != self.lon.shape:
+                raise ValueError("'{}' must have the same length as 'lon' and 'lat'".format(name))
+        self.index = None
+        self._mercator = None
+
+    @classmethod
+    def from_points(cls, points):
+        if isinstance(points, TrackPath):
+            return points
+        n = len(points)
+        lon = np.fromiter((p.lon for p in points), dtype=np.float64, count=n)
+        lat = np.fromiter((p.lat for p in points), dtype=np.float64, count=n)
+        return cls(lon, lat)
+
+    @classmethod
+    def from_coords(cls, coords):
+        """Build a path from a (n, 2) or (n, 3) array-like of (lon, lat[, alt])"""
+        if len(coords) == 0:
+            return cls([], [])
+        coords = np.asarray(coords, dtype=np.float64)
+        if coords.ndim != 2 or coords.shape[1] < 2:
+            raise ValueError("Expected an array of shape (n, 2) or (n, 3), got {}".format(coords.shape))
+        alt = coords[:, 2] if coords.shape[1] > 2 else None
+        return cls(coords[:, 0], coords[:, 1], alt=alt)
+
+    def __len__(self):
+        return len(self.lon)
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            sub = TrackPath(
+                self.lon[item],
+                self.lat[item],
+                alt=None if self.alt is None else self.alt[item],
+                time=None if self.time is None else self.time[item]
+            )
+            if self._mercator is not None:
+                x, y = self._mercator
+                sub._mercator = x[item], y[item]
+            if self.index is not None:
+                sub.index = self.index[item]
+            return sub
+        return Point(float(self.lon[item]), float(self.lat[item]))
+
+    def __iter__(self):
+        for lon, lat in zip(self.lon.tolist(), self.lat.tolist()):
+            yield Point(lon, lat)
+
+    @property
+    def coords(self):
+        return np.column_stack((self.lon, self.lat))
+
+    def mercator(self):
+        """Web Mercator coordinates (x, y) of every point, projected once for the whole path"""
+        if self._mercator is None:
+            self._mercator = geo.utils.to_mercator(self.lon, self.lat)
+        return self._mercator
+
+    def decimate(self, tolerance, keep=()):
+        """
+        Drop the points that don't change the shape of the path by more than `tolerance` Web Mercator meters
+        (Douglas-Peucker), e.g. `ign.levels[zoom].res / 2` to stay within half a pixel at a given zoom level.
+
+        The first and last points, and the points at the indices in `keep`, are always kept: the path is simplified
+        independently between two such points. Douglas-Peucker doesn't preserve topology: a simplified path may cross
+        itself where the original one came back within `tolerance` of itself.
+
+        The result remembers the original position of its points in `index`.
+        """
+        x, y = self.mercator()
+        bounds = np.union1d([0, len(self) - 1], np.asarray(keep, dtype=np.intp)) if len(self) else []
+        kept = [bounds[:1]]
+        for a, b in zip(bounds[:-1], bounds[1:]):
+            kept.append(a + geo.polyline.simplify(x[a:b + 1], y[a:b + 1], tolerance)[1:])
+        kept = np.concatenate(kept).astype(np.intp) if len(self) else np.arange(0)
+        sub = TrackPath(
+            self.lon[kept],
+            self.lat[kept],
+            alt=None if self.alt is None else self.alt[kept],
+            time=None if self.time is None else self.time[kept]
+        )
+        sub._mercator = x[kept], y[kept]
+        sub.index = self.original_index(kept)
+        return sub
+
+    def original_index(self, i):
+        """Position of point(s) `i` in the path this one was decimated from (`i` itself if it wasn't decimated)"""
+        return i if self.index is None else self.index[i]
+
+    @property
+    def original_length(self):
+        """Number of points of the path this one was decimated from"""
+        return len(self) if self.index is None or not len(self) else int(self.index[-1]) + 1
+
+    def at_index(self, idx):
+        """
+        Coordinates (lon, lat) of the points at the original indices `idx`. Points dropped by `decimate` are
+        interpolated along the simplified path, from which they are at most `tolerance` away.
+        """
+        idx = np.asarray(idx)
+        if self.index is None:
+            return self.lon[idx], self.lat[idx]
+        return np.interp(idx, self.index, self.lon), np.interp(idx, self.index, self.lat)
+
+    def bbox(self, start=0, end=None):
+        """Bounding box of the points in [start, end)"""
+        lon, lat = self.lon[start:end], self.lat[start:end]
+        if len(lon) == 0:
+            return Bbox()
+        return Bbox(float(lon.min()), float(lon.max()), float(lat.min()), float(lat.max()))
+
+    def __repr__(self):
+        return "TrackPath({} points)".format(len(self))
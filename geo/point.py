@@ -1,10 +1,10 @@
 from math import sin, cos, sqrt, atan2, radians, asin, pi, degrees
-import pyproj
 import geo.utils
-import geopy.distance
 
 
 class Point:
+    __slots__ = ("lon", "lat")
+
     def __init__(self, lon, lat):
         self.lon = lon
         self.lat = lat
@@ -18,6 +18,7 @@ class Point:
 
     @classmethod
     def distance(cls, p1, p2):
+        import geopy.distance
         p1 = geopy.distance.lonlat(*p1)
         p2 = geopy.distance.lonlat(*p2)
         return geopy.distance.distance(p1, p2).km
@@ -0,0 +1,85 @@
+"""
+Vectorized polyline helpers, for coordinates in any planar system (pixels, Web Mercator meters...).
+"""
+import numpy as np
+
+
+def clip(x, y, rect):
+    """
+    Clip the polyline (x, y) to `rect` = (x_min, y_min, x_max, y_max) with the Liang-Barsky algorithm, applied to all
+    segments at once.
+
+    Return a list of (x, y) array pairs, one per visible run: a path leaving and re-entering the rectangle gives several
+    runs.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    x_min, y_min, x_max, y_max = rect
+    if len(x) < 2:
+        inside = (x >= x_min) & (x <= x_max) & (y >= y_min) & (y <= y_max)
+        return [(x, y)] if inside.all() and len(x) else []
+
+    x0, y0 = x[:-1], y[:-1]
+    dx, dy = np.diff(x), np.diff(y)
+    t0 = np.zeros(len(dx))
+    t1 = np.ones(len(dx))
+    keep = np.ones(len(dx), dtype=bool)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for p, q in [(-dx, x0 - x_min), (dx, x_max - x0), (-dy, y0 - y_min), (dy, y_max - y0)]:
+            r = q / p
+            entering = p < 0
+            leaving = p > 0
+            t0 = np.where(entering, np.maximum(t0, r), t0)
+            t1 = np.where(leaving, np.minimum(t1, r), t1)
+            keep &= ~((p == 0) & (q < 0))
+    keep &= t0 <= t1
+
+    idx = np.flatnonzero(keep)
+    if not len(idx):
+        return []
+    sx, sy = x0[idx] + t0[idx] * dx[idx], y0[idx] + t0[idx] * dy[idx]
+    ex, ey = x0[idx] + t1[idx] * dx[idx], y0[idx] + t1[idx] * dy[idx]
+
+    # A run goes on as long as consecutive segments are kept and unclipped at their shared vertex
+    joined = (np.diff(idx) == 1) & (t1[idx[:-1]] == 1) & (t0[idx[1:]] == 0)
+    bounds = np.concatenate([[0], np.flatnonzero(~joined) + 1, [len(idx)]])
+    runs = []
+    for a, b in zip(bounds[:-1], bounds[1:]):
+        runs.append((
+            np.concatenate([[sx[a]], ex[a:b]]),
+            np.concatenate([[sy[a]], ey[a:b]])
+        ))
+    return runs
+
+
+def simplify(x, y, tolerance):
+    """
+    Douglas-Peucker simplification: indices of the points to keep so that no dropped point is further than `tolerance`
+    from the simplified polyline. First and last points are always kept.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(x)
+    if n < 3:
+        return np.arange(n)
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, n - 1)]
+    while stack:
+        a, b = stack.pop()
+        if b - a < 2:
+            continue
+        px, py = x[a + 1:b], y[a + 1:b]
+        dx, dy = x[b] - x[a], y[b] - y[a]
+        norm = np.hypot(dx, dy)
+        if norm == 0:
+            dist = np.hypot(px - x[a], py - y[a])
+        else:
+            dist = np.abs(dy * (px - x[a]) - dx * (py - y[a])) / norm
+        i = int(np.argmax(dist))
+        if dist[i] > tolerance:
+            m = a + 1 + i
+            keep[m] = True
+            stack.append((a, m))
+            stack.append((m, b))
+    return np.flatnonzero(keep)
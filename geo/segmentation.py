@@ -0,0 +1,59 @@
+"""
+Split a path into pages without building a `Bbox` per point.
+
+The bounding box of `path[start:curr + 1]` is tracked through running extrema of longitude and latitude, and its
+dimensions are measured exactly like `Bbox.compute_dims` (between the midpoints of opposite sides), but with the
+vectorized ellipsoidal kernel of `geo.distance` instead of geopy. Dimensions agree with geopy to a relative 1e-5 for
+boxes up to 50 km wide, so page boundaries only differ from the point-by-point `Bbox` loop when a box lands within a few
+decimeters of the page size.
+
+Points are examined in chunks of doubling size, so that the cost is linear in the length of the segment and the first
+point overflowing the page is found exactly, without assuming that the box dimensions grow monotonically.
+"""
+import numpy as np
+
+import geo.distance
+
+INITIAL_CHUNK = 256
+
+
+def box_dims(lon_min, lon_max, lat_min, lat_max):
+    """Width & height (in km) of the boxes with the given bounds, measured between the midpoints of opposite sides"""
+    lon_c = 0.5 * (lon_min + lon_max)
+    lat_c = 0.5 * (lat_min + lat_max)
+    width = geo.distance.ellipsoid(lon_min, lat_c, lon_max, lat_c)
+    height = geo.distance.ellipsoid(lon_c, lat_max, lon_c, lat_min)
+    return width, height
+
+
+def find_end(lon, lat, start, b_max, b_min, chunk=INITIAL_CHUNK):
+    """
+    Return the index of the first point after `start` that doesn't fit on the page, i.e. such that the bounding box of
+    `path[start:end + 1]` has its longest side >= `b_max` or its shortest side >= `b_min`. Return `len(lon)` if the
+    whole remaining path fits.
+    """
+    n = len(lon)
+    curr = start
+    bounds = None
+    while curr < n:
+        stop = min(n, curr + chunk)
+        lon_min = np.minimum.accumulate(lon[curr:stop])
+        lon_max = np.maximum.accumulate(lon[curr:stop])
+        lat_min = np.minimum.accumulate(lat[curr:stop])
+        lat_max = np.maximum.accumulate(lat[curr:stop])
+        if bounds is not None:
+            np.minimum(lon_min, bounds[0], out=lon_min)
+            np.maximum(lon_max, bounds[1], out=lon_max)
+            np.minimum(lat_min, bounds[2], out=lat_min)
+            np.maximum(lat_max, bounds[3], out=lat_max)
+
+        width, height = box_dims(lon_min, lon_max, lat_min, lat_max)
+        fits = (np.maximum(width, height) < b_max) & (np.minimum(width, height) < b_min)
+        overflow = np.flatnonzero(~fits)
+        if len(overflow):
+            return curr + int(overflow[0])
+
+        bounds = lon_min[-1], lon_max[-1], lat_min[-1], lat_max[-1]
+        curr = stop
+        chunk *= 2
+    return n
@@ -1,8 +1,21 @@
-import pyproj
+import numpy as np
 from math import radians, degrees
 
 EARTH_RADIUS = 6373.0
-mercator = pyproj.Proj(init="epsg:3857")
+_mercator = None
+
+def mercator(lon, lat, inverse=False):
+    """Web Mercator projection, built on first use so that importing `geo` doesn't load pyproj"""
+    global _mercator
+    if _mercator is None:
+        import pyproj
+        _mercator = pyproj.Proj(init="epsg:3857")
+    return _mercator(lon, lat, inverse=inverse)
+
+def to_mercator(lon, lat):
+    """Project arrays of longitudes and latitudes to Web Mercator in a single call"""
+    x, y = mercator(np.asarray(lon, dtype=np.float64), np.asarray(lat, dtype=np.float64))
+    return np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64)
 
 def convert(*args, from_unit=None, to_unit=None):
     units = {
@@ -1,14 +1,13 @@
+import importlib
+
 from .zoom import zoom as levels
 from .mset import DEFAULT as __default_mset
 import ign.layers as layers
-from owslib.wmts import WebMapTileService
-import ign.api as api
 import ign.zoom as zoom
 TILE_SIZE = 256
 API = "https://wxs.ign.fr/choisirgeoportail/geoportail/wmts"
 ALTI_API = "https://wxs.ign.fr/choisirgeoportail/alti/rest/"
 
-wmts = WebMapTileService(API)
 
 tile_query = "&".join([
     "SERVICE=WMTS",
@@ -35,4 +34,12 @@ def query(layer, level, col, row):
     )
 
 def alti(lon, lat):
-    return ALTI_API + alti_query.format(lon=lon, lat=lat)
\ No newline at end of file
+    return ALTI_API + alti_query.format(lon=lon, lat=lat)
+
+# Submodules pulling heavy dependencies (requests, PIL, pyproj...) are only imported on first access
+_LAZY_SUBMODULES = {"api", "cache", "dem", "elevation", "http", "tms"}
+
+def __getattr__(name):
+    if name in _LAZY_SUBMODULES:
+        return importlib.import_module("ign." + name)
+    raise AttributeError("module 'ign' has no attribute '{}'".format(name))
\ No newline at end of file
@@ -1,18 +1,22 @@
-from owslib.wmts import WebMapTileService
 import ign.mset
-import requests
-import json
+import ign.tms
+from ign.cache import TileCache, CacheMiss
+from ign.elevation import ElevationClient
+from ign.http import MAX_CONNECTIONS_PER_HOST
+import ign.http
 import io
+import utils.instrument
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache
 from math import floor
-import pyproj
 from .zoom import zoom
-from PIL import Image
 
 
 API = "https://wxs.ign.fr/choisirgeoportail/geoportail/wmts?"
 ALTI_API = "https://wxs.ign.fr/choisirgeoportail/alti/rest/"
 
-wmts = WebMapTileService(API)
+# Replace (or set `offline`) to control where tiles are read from
+tile_cache = TileCache()
 
 tile_query = "&".join([
     "SERVICE=WMTS",
@@ -38,17 +42,23 @@ def query(layer, level, col, row):
     )
 
 def tile_matrix(level):
-    return wmts.tilematrixsets[ign.mset.DEFAULT].tilematrix[str(level)]
+    return ign.tms.registry.get(ign.mset.DEFAULT, level)
+
+def refresh_tile_matrices():
+    """Rebuild the local tile matrix snapshot from the live capabilities document"""
+    ign.tms.registry.refresh(API, msets=[ign.mset.DEFAULT])
+    tile_attributes.cache_clear()
 
 def alti_query(lon, lat):
     return ALTI_API + "elevation.json?lon={lon}&lat={lat}&zonly=true".format(lon=lon, lat=lat)
 
+# Any `ign.elevation.ElevationSource`, e.g. a local `ign.dem.DemSource` for offline use
+elevation_source = ElevationClient(alti_query)
+
 def get_elevation(lon, lat):
-    encode = lambda l: "|".join([str(v) for v in l])
-    r = requests.get(alti_query(encode(lon), encode(lat))).content
-    el = json.load(io.BytesIO(r))["elevations"]
-    return el
+    return elevation_source.get(lon, lat)
 
+@lru_cache(maxsize=None)
 def tile_attributes(level):
     matrix = tile_matrix(level)
     tile_size = matrix.tileheight * zoom[level].res  # taille d'une tuile en mètres
@@ -56,10 +66,13 @@ def tile_attributes(level):
     return tile_size, (x0, y0)
 
 def get_coords(p, level):
-    tile_size, (x0, y0) = tile_attributes(level)
-
     # Convert coordinates to Mercator
     x, y = p.as_mercator()
+    return get_mercator_coords(x, y, level)
+
+def get_mercator_coords(x, y, level):
+    """Tile column & row of already projected coordinates"""
+    tile_size, (x0, y0) = tile_attributes(level)
 
     # Get tile column & row
     col = floor((x - x0) / tile_size)
@@ -75,20 +88,66 @@ def reverse_coords(col, row, level):
 
     return x, y
 
-def get_tile(col, row, layer, level, strict=False):
+def blank_tile(level):
+    from PIL import Image
+    matrix = tile_matrix(level)
+    return Image.new("RGB", (matrix.tilewidth, matrix.tileheight))
+
+def fetch_tile(col, row, layer, level, strict=False):
+    """Tile (col, row) as an image, or None if it isn't cached (offline mode) or couldn't be downloaded"""
+    from PIL import Image
+    key = tile_cache.key(layer, ign.mset.DEFAULT, level, col, row)
+    content = tile_cache.get(key)
+    if content is not None:
+        utils.instrument.count("tiles.cached")
+        return Image.open(io.BytesIO(content))
+    if tile_cache.offline:
+        utils.instrument.count("tiles.blank")
+        print("Tile ({col}, {row}) for level {lvl} is not cached (offline mode)".format(col=col, row=row, lvl=level))
+        if strict:
+            raise CacheMiss(key)
+        return None
+
     url = API + query(layer=layer, level=level, col=col, row=row)
-    response = requests.get(url)
+    response = None
     try:
+        # Network errors (`requests.RequestException`) are OSErrors too
+        response = ign.http.get(url)
         bin_im = io.BytesIO(response.content)
-        return Image.open(bin_im)
+        im = Image.open(bin_im)
     except OSError as e:
         print("Loading tile ({col}, {row}) for level {lvl} failed:".format(col=col, row=row, lvl=level))
-        print(response.text)
+        print(e if response is None else response.text)
         print("\nTry clicking the following link:")
         print(url)
         if strict:
             raise e
         else:
-            imsize, _ = tile_attributes(level)
-            return Image.new("RGB", (imsize, imsize))
+            utils.instrument.count("tiles.blank")
+            return None
+    utils.instrument.count("tiles.fetched")
+    utils.instrument.count("tiles.bytes", len(response.content))
+    tile_cache.put(key, response.content)
+    return im
 
+def get_tile(col, row, layer, level, strict=False):
+    """Tile (col, row) as an image, or a blank tile if it can't be obtained (see `fetch_tile`)"""
+    im = fetch_tile(col, row, layer, level, strict=strict)
+    return blank_tile(level) if im is None else im
+
+def get_tiles(coords, layer, level, workers=MAX_CONNECTIONS_PER_HOST, strict=False):
+    """
+    Fetch all tiles in `coords` concurrently, yielding `((col, row), image)` pairs as soon as they are available. The
+    image is None for tiles that couldn't be obtained (see `fetch_tile`).
+    """
+    def fetch(col, row):
+        im = fetch_tile(col, row, layer, level, strict=strict)
+        if im is not None:
+            with utils.instrument.span("tiles.decode"):
+                im.load()  # decode in the worker thread
+        return im
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(fetch, col, row): (col, row) for col, row in coords}
+        for future in as_completed(futures):
+            yield futures[future], future.result()
@@ -0,0 +1,155 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+DEFAULT_DIR = os.path.join(os.path.expanduser("~"), ".cache", "itinerator", "tiles")
+DEFAULT_MAX_SIZE = 512 * 1024 * 1024  # 512 Mo
+
+
+class CacheMiss(LookupError):
+    """Raised when a tile is missing from the cache and the network is not allowed"""
+    pass
+
+
+class TileCache:
+    """
+    On-disk store of raw WMTS tiles.
+
+    Tiles are addressed by a hash of (layer, tile matrix set, level, col, row) and kept as the exact bytes returned by
+    the server. Once the total size exceeds `max_size` bytes, least recently used tiles are evicted. In `offline` mode,
+    callers must never hit the network: a miss should be reported as a `CacheMiss`.
+    """
+    def __init__(self, root=DEFAULT_DIR, max_size=DEFAULT_MAX_SIZE, offline=False):
+        self.root = root
+        self.max_size = max_size
+        self.offline = offline
+        self.hits = 0
+        self.misses = 0
+        self._index = None  # LRU order: path -> size in bytes, oldest first
+        self._size = 0
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def key(layer, mset, level, col, row):
+        return "{}/{}/{}/{}/{}".format(layer, mset, level, col, row)
+
+    def path(self, key):
+        digest = hashlib.sha1(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.root, digest[:2], digest + ".jpg")
+
+    @property
+    def index(self):
+        with self._lock:
+            if self._index is None:
+                self._index = self._scan()
+                self._size = sum(self._index.values())
+        return self._index
+
+    def _scan(self):
+        entries = []
+        if os.path.isdir(self.root):
+            for dirpath, _, fnames in os.walk(self.root):
+                for fname in fnames:
+                    if not fname.endswith(".jpg"):
+                        continue
+                    path = os.path.join(dirpath, fname)
+                    stat = os.stat(path)
+                    entries.append((stat.st_mtime, path, stat.st_size))
+        entries.sort()
+        return OrderedDict((path, size) for _, path, size in entries)
+
+    def get(self, key):
+        """Return the raw bytes of a tile, or None if it is not cached"""
+        path = self.path(key)
+        with self._lock:
+            if path not in self.index:
+                self.misses += 1
+                return None
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path, None)
+        except OSError:
+            # File removed behind our back
+            with self._lock:
+                self._forget(path)
+                self.misses += 1
+            return None
+        with self._lock:
+            if path in self.index:
+                self.index.move_to_end(path)
+            self.hits += 1
+        return data
+
+    def put(self, key, data):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = "{}.{}.{}.tmp".format(path, os.getpid(), threading.get_ident())
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+        with self._lock:
+            self._forget(path)
+            self.index[path] = len(data)
+            self._size += len(data)
+            self.evict()
+
+    def _forget(self, path):
+        size = self.index.pop(path, None)
+        if size is not None:
+            self._size -= size
+
+    def evict(self):
+        """Remove least recently used tiles until the cache fits in `max_size`"""
+        with self._lock:
+            index = self.index
+            while self._size > self.max_size and index:
+                path, size = index.popitem(last=False)
+                self._size -= size
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def clear(self):
+        with self._lock:
+            for path in list(self.index):
+                self._forget(path)
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def __contains__(self, key):
+        return self.path(key) in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+    @property
+    def size(self):
+        self.index
+        return self._size
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.
+
+    @property
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hit_rate,
+            "tiles": len(self),
+            "size": self.size
+        }
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+
+    def __repr__(self):
+        return "TileCache(root={}, max_size={}, offline={})".format(self.root, self.max_size, self.offline)
@@ -0,0 +1,142 @@
+"""
+Local digital elevation model, as an offline alternative to the ALTI service.
+
+A DEM directory contains one `<name>.npy` float32 raster per tile, next to a `<name>.json` header:
+    {"ncols": 1000, "nrows": 1000, "xllcorner": 700000.0, "yllcorner": 6600000.0, "cellsize": 5.0,
+     "nodata": -99999.0, "crs": "epsg:2154"}
+Rasters are memory-mapped, so only the pages around the requested points are actually read. ESRI ASCII grids (such as
+IGN's RGE ALTI) can be converted once with `convert_asc`.
+"""
+import json
+import os
+
+import numpy as np
+
+from ign.elevation import ElevationSource
+
+NODATA = -99999.  # same convention as the ALTI service
+WGS84 = "epsg:4326"
+
+
+class DemTile:
+    def __init__(self, fname):
+        with open(fname + ".json", "rt", encoding="utf-8") as f:
+            header = json.load(f)
+        self.name = os.path.basename(fname)
+        self.data = np.load(fname + ".npy", mmap_mode="r")
+        self.nrows, self.ncols = self.data.shape
+        self.x0 = header["xllcorner"]
+        self.cellsize = header["cellsize"]
+        self.y0 = header["yllcorner"] + self.nrows * self.cellsize  # top edge
+        self.nodata = header.get("nodata", NODATA)
+        self.crs = header.get("crs", WGS84)
+
+    @property
+    def bounds(self):
+        return self.x0, self.x0 + self.ncols * self.cellsize, self.y0 - self.nrows * self.cellsize, self.y0
+
+    def contains(self, x, y):
+        x_min, x_max, y_min, y_max = self.bounds
+        return (x >= x_min) & (x < x_max) & (y > y_min) & (y <= y_max)
+
+    def sample(self, x, y):
+        """Bilinear interpolation between cell centers. Any nodata neighbour gives `NODATA`."""
+        col = (x - self.x0) / self.cellsize - 0.5
+        row = (self.y0 - y) / self.cellsize - 0.5
+        col = np.clip(col, 0, self.ncols - 1)
+        row = np.clip(row, 0, self.nrows - 1)
+        c0 = np.minimum(np.floor(col).astype(np.intp), max(self.ncols - 2, 0))
+        r0 = np.minimum(np.floor(row).astype(np.intp), max(self.nrows - 2, 0))
+        c1 = np.minimum(c0 + 1, self.ncols - 1)
+        r1 = np.minimum(r0 + 1, self.nrows - 1)
+        dc = col - c0
+        dr = row - r0
+
+        z00 = self.data[r0, c0].astype(np.float64)
+        z01 = self.data[r0, c1].astype(np.float64)
+        z10 = self.data[r1, c0].astype(np.float64)
+        z11 = self.data[r1, c1].astype(np.float64)
+        z = (z00 * (1 - dc) + z01 * dc) * (1 - dr) + (z10 * (1 - dc) + z11 * dc) * dr
+
+        missing = (z00 == self.nodata) | (z01 == self.nodata) | (z10 == self.nodata) | (z11 == self.nodata)
+        z[missing] = NODATA
+        return z
+
+
+class DemSource(ElevationSource):
+    """Elevation source reading every tile of a DEM directory"""
+    def __init__(self, dir):
+        self.dir = dir
+        self.tiles = [
+            DemTile(os.path.join(dir, fname[:-len(".json")]))
+            for fname in sorted(os.listdir(dir)) if fname.endswith(".json")
+        ]
+        self._projections = {}
+
+    def project(self, crs, lon, lat):
+        if crs.lower() == WGS84:
+            return lon, lat
+        if crs not in self._projections:
+            import pyproj
+            self._projections[crs] = pyproj.Proj(init=crs)
+        x, y = self._projections[crs](lon, lat)
+        return np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64)
+
+    def sample(self, lon, lat):
+        """Elevations of all points as a float64 array, `NODATA` outside of the DEM"""
+        lon = np.asarray(lon, dtype=np.float64)
+        lat = np.asarray(lat, dtype=np.float64)
+        z = np.full(lon.shape, NODATA)
+        todo = np.ones(lon.shape, dtype=bool)
+        for tile in self.tiles:
+            if not todo.any():
+                break
+            x, y = self.project(tile.crs, lon[todo], lat[todo])
+            inside = tile.contains(x, y)
+            if not inside.any():
+                continue
+            idx = np.flatnonzero(todo)[inside]
+            z[idx] = tile.sample(x[inside], y[inside])
+            todo[idx] = False
+        return z
+
+    def get(self, lon, lat):
+        return self.sample(lon, lat).tolist()
+
+
+def save_tile(data, header, dir, name):
+    """Store a raster (2-D array, first row at the top) and its header as a DEM tile"""
+    os.makedirs(dir, exist_ok=True)
+    data = np.asarray(data, dtype=np.float32)
+    header = dict(header, nrows=data.shape[0], ncols=data.shape[1])
+    np.save(os.path.join(dir, name + ".npy"), data)
+    with open(os.path.join(dir, name + ".json"), "wt", encoding="utf-8") as f:
+        json.dump(header, f)
+
+
+def convert_asc(fname, dir, crs=WGS84):
+    """Convert an ESRI ASCII grid into a DEM tile of `dir`"""
+    header = {}
+    with open(fname, "rt") as f:
+        for _ in range(6):
+            pos = f.tell()
+            line = f.readline().split()
+            if not line or not line[0][0].isalpha():
+                f.seek(pos)
+                break
+            header[line[0].lower()] = float(line[1])
+        data = np.loadtxt(f, dtype=np.float32)
+
+    cellsize = header["cellsize"]
+    if "xllcenter" in header:
+        header["xllcorner"] = header["xllcenter"] - cellsize / 2
+        header["yllcorner"] = header["yllcenter"] - cellsize / 2
+    name = os.path.splitext(os.path.basename(fname))[0]
+    save_tile(data, {
+        "xllcorner": header["xllcorner"],
+        "yllcorner": header["yllcorner"],
+        "cellsize": cellsize,
+        "nodata": header.get("nodata_value", NODATA),
+        "crs": crs
+    }, dir, name)
+    return name
@@ -0,0 +1,177 @@
+import abc
+import os
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import ign.http
+
+DEFAULT_DB = os.path.join(os.path.expanduser("~"), ".cache", "itinerator", "elevations.sqlite")
+DEFAULT_GRID = 1e-5  # degrees, about 1 m
+DEFAULT_MAX_ENTRIES = 5000000
+BATCH_SIZE = 150  # points per request, keeps URLs well under 8 kB
+
+
+class ElevationSource(abc.ABC):
+    """Anything able to return the elevations (in m) of a list of points"""
+    @abc.abstractmethod
+    def get(self, lon, lat):
+        pass
+
+
+class ElevationCache:
+    """
+    Persistent elevation store, keyed by coordinates snapped to a grid of `grid` degrees.
+
+    Entries live in an SQLite database. Past `max_entries`, least recently used entries are evicted.
+    """
+    def __init__(self, fname=DEFAULT_DB, grid=DEFAULT_GRID, max_entries=DEFAULT_MAX_ENTRIES):
+        self.fname = fname
+        self.grid = grid
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._db = None
+        self._clock = 0
+        self._lock = threading.Lock()
+
+    @property
+    def db(self):
+        if self._db is None:
+            if self.fname != ":memory:":
+                os.makedirs(os.path.dirname(self.fname), exist_ok=True)
+            self._db = sqlite3.connect(self.fname, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS elevation ("
+                "grid REAL, qlon INTEGER, qlat INTEGER, z REAL, used INTEGER, "
+                "PRIMARY KEY (grid, qlon, qlat))"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS elevation_used ON elevation (used)")
+            self._clock = self._db.execute("SELECT COALESCE(MAX(used), 0) FROM elevation").fetchone()[0]
+        return self._db
+
+    def key(self, lon, lat):
+        return int(round(lon / self.grid)), int(round(lat / self.grid))
+
+    def coords(self, key):
+        """Representative coordinates of the grid cell `key`"""
+        qlon, qlat = key
+        return qlon * self.grid, qlat * self.grid
+
+    def get_many(self, keys):
+        """Return a dict {key: elevation} for all cached keys"""
+        found = {}
+        with self._lock:
+            db = self.db
+            keys = list(keys)
+            for i in range(0, len(keys), 400):
+                chunk = keys[i:i + 400]
+                conditions = " OR ".join(["(qlon = ? AND qlat = ?)"] * len(chunk))
+                params = [self.grid] + [v for key in chunk for v in key]
+                rows = db.execute("SELECT qlon, qlat, z FROM elevation WHERE grid = ? AND ({})".format(conditions), params)
+                for qlon, qlat, z in rows:
+                    found[(qlon, qlat)] = z
+            self._clock += 1
+            db.executemany(
+                "UPDATE elevation SET used = ? WHERE grid = ? AND qlon = ? AND qlat = ?",
+                [(self._clock, self.grid, qlon, qlat) for qlon, qlat in found]
+            )
+            db.commit()
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, values):
+        with self._lock:
+            db = self.db
+            self._clock += 1
+            db.executemany(
+                "INSERT OR REPLACE INTO elevation VALUES (?, ?, ?, ?, ?)",
+                [(self.grid, qlon, qlat, z, self._clock) for (qlon, qlat), z in values.items()]
+            )
+            db.commit()
+        self.evict()
+
+    def evict(self):
+        with self._lock:
+            db = self.db
+            count = db.execute("SELECT COUNT(*) FROM elevation").fetchone()[0]
+            if count > self.max_entries:
+                db.execute(
+                    "DELETE FROM elevation WHERE rowid IN (SELECT rowid FROM elevation ORDER BY used LIMIT ?)",
+                    (count - self.max_entries,)
+                )
+                db.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self.db.execute("SELECT COUNT(*) FROM elevation").fetchone()[0]
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.
+
+    @property
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hit_rate,
+            "entries": len(self)
+        }
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+
+class ElevationClient(ElevationSource):
+    """
+    Query elevations from the remote ALTI service in bounded batches, sent concurrently over the shared HTTP session.
+
+    Points are snapped to the cache grid and deduplicated before querying, so that points already known (or repeated
+    within the same call) are never sent twice.
+    """
+    def __init__(self, query, cache=None, batch_size=BATCH_SIZE, workers=ign.http.MAX_CONNECTIONS_PER_HOST,
+                 retries=ign.http.RETRIES):
+        self.query = query
+        self.cache = ElevationCache() if cache is None else cache
+        self.batch_size = batch_size
+        self.workers = workers
+        self.retries = retries
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def fetch(self, keys):
+        """Query the elevation service for a batch of grid cells"""
+        coords = [self.cache.coords(key) for key in keys]
+        encode = lambda l: "|".join(["{:.7f}".format(v) for v in l])
+        url = self.query(encode([lon for lon, _ in coords]), encode([lat for _, lat in coords]))
+        with self._lock:
+            self.requests += 1
+        response = ign.http.get(url, retries=self.retries)
+        response.raise_for_status()
+        elevations = response.json()["elevations"]
+        if len(elevations) != len(keys):
+            raise ValueError("Expected {} elevations, got {}".format(len(keys), len(elevations)))
+        return dict(zip(keys, elevations))
+
+    def get(self, lon, lat):
+        keys = [self.cache.key(x, y) for x, y in zip(lon, lat)]
+        values = self.cache.get_many(set(keys))
+        missing = sorted(set(keys) - set(values))
+        if missing:
+            batches = [missing[i:i + self.batch_size] for i in range(0, len(missing), self.batch_size)]
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                fetched = {}
+                for result in executor.map(self.fetch, batches):
+                    fetched.update(result)
+            self.cache.put_many(fetched)
+            values.update(fetched)
+        return [values[key] for key in keys]
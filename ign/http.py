@@ -0,0 +1,202 @@
+"""
+HTTP transport shared by every remote service (WMTS tiles, ALTI elevations, Overpass localities).
+
+All requests go through `get`, which provides:
+- pooled keep-alive connections, and at most `MAX_CONNECTIONS_PER_HOST` in-flight requests per host;
+- default timeouts (`TIMEOUT`);
+- retries of connection errors, timeouts and transient statuses (`RETRY_STATUSES`), with exponential backoff and full
+  jitter, honouring `Retry-After`;
+- optional per-host rate limits (see `limit`);
+- single-flight: concurrent requests for the same URL share a single response;
+- per-endpoint counters (see `stats`).
+"""
+import random
+import threading
+import time
+from concurrent.futures import Future
+from urllib.parse import urlsplit
+
+# Maximum number of simultaneous requests sent to a single host
+MAX_CONNECTIONS_PER_HOST = 8
+TIMEOUT = (5, 30)  # seconds, to connect and between two bytes received
+RETRIES = 3
+BACKOFF = 0.5  # seconds, doubled after each attempt
+MAX_BACKOFF = 30
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+_session = None
+_host_slots = {}
+_rate_limits = {}
+_inflight = {}
+_endpoints = {}
+_lock = threading.Lock()
+
+
+def get_session():
+    """Session shared by all requests, created (and `requests` imported) on first use"""
+    global _session
+    with _lock:
+        if _session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+            _session = requests.Session()
+            _session.mount("https://", HTTPAdapter(pool_maxsize=MAX_CONNECTIONS_PER_HOST))
+            _session.mount("http://", HTTPAdapter(pool_maxsize=MAX_CONNECTIONS_PER_HOST))
+        return _session
+
+
+def host_slot(url):
+    """Semaphore bounding the number of in-flight requests to the host of `url`"""
+    host = urlsplit(url).netloc
+    with _lock:
+        if host not in _host_slots:
+            _host_slots[host] = threading.BoundedSemaphore(MAX_CONNECTIONS_PER_HOST)
+        return _host_slots[host]
+
+
+class TokenBucket:
+    """Allow `rate` requests per second on average, with bursts of up to `burst` requests"""
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Wait until a token is available, and take it"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+                self.last = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def limit(host, rate, burst=1):
+    """Send at most `rate` requests per second to `host` (bursts of `burst` requests allowed). `rate=None` removes it"""
+    with _lock:
+        if rate is None:
+            _rate_limits.pop(host, None)
+        else:
+            _rate_limits[host] = TokenBucket(rate, burst)
+
+
+class EndpointStats:
+    """Counters of the requests sent to one endpoint (host and path)"""
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.shared = 0
+        self.bytes = 0
+        self.latency = 0.
+        self.max_latency = 0.
+
+    def as_dict(self):
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "retries": self.retries,
+            "shared": self.shared,
+            "bytes": self.bytes,
+            "latency": self.latency,
+            "mean_latency": self.latency / self.requests if self.requests else 0.,
+            "max_latency": self.max_latency
+        }
+
+
+def endpoint(url):
+    parts = urlsplit(url)
+    return parts.netloc + parts.path
+
+
+def _record(url, **counts):
+    with _lock:
+        entry = _endpoints.setdefault(endpoint(url), EndpointStats())
+        for name, value in counts.items():
+            setattr(entry, name, getattr(entry, name) + value)
+        entry.max_latency = max(entry.max_latency, counts.get("latency", 0.))
+
+
+def stats():
+    """Counters of every endpoint queried so far, as a dict {endpoint: counters}"""
+    with _lock:
+        return {name: entry.as_dict() for name, entry in sorted(_endpoints.items())}
+
+
+def reset_stats():
+    with _lock:
+        _endpoints.clear()
+
+
+def backoff(attempt, response=None):
+    """Delay before retrying, after `attempt` failed attempts: `Retry-After` if given, else exponential with jitter"""
+    if response is not None:
+        try:
+            return min(MAX_BACKOFF, float(response.headers["Retry-After"]))
+        except (KeyError, ValueError):
+            pass
+    return random.uniform(0, min(MAX_BACKOFF, BACKOFF * 2 ** attempt))
+
+
+def _send(url, timeout, retries, **kwargs):
+    import requests
+    session = get_session()
+    host = urlsplit(url).netloc
+    for attempt in range(retries + 1):
+        bucket = _rate_limits.get(host)
+        if bucket is not None:
+            bucket.acquire()
+        start = time.perf_counter()
+        try:
+            with host_slot(url):
+                response = session.get(url, timeout=timeout, **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            _record(url, requests=1, errors=1, latency=time.perf_counter() - start)
+            if attempt == retries:
+                raise e
+            _record(url, retries=1)
+            time.sleep(backoff(attempt))
+            continue
+
+        failed = response.status_code >= 400
+        _record(url, requests=1, errors=int(failed), bytes=len(response.content), latency=time.perf_counter() - start)
+        if response.status_code in RETRY_STATUSES and attempt < retries:
+            _record(url, retries=1)
+            time.sleep(backoff(attempt, response))
+            continue
+        return response
+
+
+def get(url, timeout=TIMEOUT, retries=RETRIES, **kwargs):
+    """
+    GET `url` and return the response, whatever its status. Raise `requests.RequestException` if no response could be
+    obtained within `retries` retries.
+    """
+    if kwargs:
+        return _send(url, timeout, retries, **kwargs)
+
+    with _lock:
+        future = _inflight.get(url)
+        leader = future is None
+        if leader:
+            future = _inflight[url] = Future()
+    if not leader:
+        _record(url, shared=1)
+        return future.result()
+
+    try:
+        response = _send(url, timeout, retries)
+        future.set_result(response)
+        return response
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with _lock:
+            del _inflight[url]
@@ -0,0 +1,92 @@
+import json
+import os
+from collections import namedtuple
+
+SNAPSHOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "tms.json")
+SNAPSHOT_VERSION = 1
+
+TileMatrix = namedtuple("TileMatrix", [
+    "identifier",
+    "scaledenominator",
+    "topleftcorner",
+    "tilewidth",
+    "tileheight",
+    "matrixwidth",
+    "matrixheight"
+])
+
+
+class TileMatrixRegistry:
+    """
+    Tile matrix parameters for every tile matrix set and level, read from a local JSON snapshot of the WMTS capabilities.
+
+    The snapshot is loaded on first access and never touches the network. Call `refresh` to rebuild it from a live
+    GetCapabilities document.
+    """
+    def __init__(self, fname=SNAPSHOT):
+        self.fname = fname
+        self._sets = None
+
+    @property
+    def sets(self):
+        if self._sets is None:
+            self._sets = self.load(self.fname)
+        return self._sets
+
+    @staticmethod
+    def load(fname):
+        with open(fname, "rt", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") != SNAPSHOT_VERSION:
+            raise ValueError("Unsupported tile matrix snapshot version {} in '{}' (expected {})".format(
+                data.get("version"), fname, SNAPSHOT_VERSION))
+        sets = {}
+        for mset, levels in data["tilematrixsets"].items():
+            sets[mset] = {
+                int(level): TileMatrix(
+                    identifier=str(level),
+                    scaledenominator=m["scaledenominator"],
+                    topleftcorner=tuple(m["topleftcorner"]),
+                    tilewidth=m["tilewidth"],
+                    tileheight=m["tileheight"],
+                    matrixwidth=m["matrixwidth"],
+                    matrixheight=m["matrixheight"]
+                )
+                for level, m in levels.items()
+            }
+        return sets
+
+    def get(self, mset, level):
+        try:
+            return self.sets[mset][int(level)]
+        except KeyError:
+            raise KeyError("No tile matrix for level {} in set '{}'".format(level, mset))
+
+    def refresh(self, url, msets=None):
+        """Download the capabilities at `url` and overwrite the snapshot with its tile matrix sets"""
+        from owslib.wmts import WebMapTileService
+
+        wmts = WebMapTileService(url)
+        data = {"version": SNAPSHOT_VERSION, "source": url, "tilematrixsets": {}}
+        for mset, tms in wmts.tilematrixsets.items():
+            if msets is not None and mset not in msets:
+                continue
+            data["tilematrixsets"][mset] = {
+                level: {
+                    "scaledenominator": m.scaledenominator,
+                    "topleftcorner": list(m.topleftcorner),
+                    "tilewidth": m.tilewidth,
+                    "tileheight": m.tileheight,
+                    "matrixwidth": m.matrixwidth,
+                    "matrixheight": m.matrixheight
+                }
+                for level, m in tms.tilematrix.items()
+            }
+        os.makedirs(os.path.dirname(self.fname), exist_ok=True)
+        with open(self.fname, "wt", encoding="utf-8") as f:
+            json.dump(data, f, indent=1)
+        self._sets = None
+        return self
+
+
+registry = TileMatrixRegistry()
@@ -1,16 +1,130 @@
-from track.track import Track
-from utils import kml
+"""
+Command line interface.
+
+    python main.py segment TRACK.kml                  # split the track into pages and print the page count
+    python main.py process TRACK.kml -o track.npz     # segment, then fetch profiles & cities, and save the result
+    python main.py render track.npz --dir ./maps/     # render one image per page
+    python main.py export-kml track.npz boxes.kml     # export page boxes as KML
+    python main.py --report run.json --profile run.prof render track.npz   # instrument any command
+
+Heavy dependencies are only imported by the commands that need them.
+"""
+import argparse
+import sys
+
 import format
+import ign
+
+
+def formats():
+    return {name: getattr(format, name) for name in ["A4", "A3", "A2", "A1", "A0", "letter", "legal"]}
+
+
+def load_path(args):
+    from utils import kml
+    path, name = kml.read_track(args.track, max_points=args.max_points)
+    print(name, "loaded,", len(path), "points found")
+    return path, name
+
+
+def segment(args):
+    from track.track import Track
+    path, name = load_path(args)
+    track = Track.from_path(path, format=formats()[args.format], zoom=args.zoom, margin=args.margin, process=False,
+                            tolerance=args.tolerance)
+    print("Track divided in", len(track), "segments.")
+    return track
+
+
+def process(args):
+    from track.track import Track
+    path, name = load_path(args)
+    track = Track.from_path(path, format=formats()[args.format], zoom=args.zoom, margin=args.margin,
+                            verbose=args.verbose, tolerance=args.tolerance)
+    track.name = name
+    print("\nTrack divided in", len(track), "segments,", len(track.path), "points kept.")
+    track.save(args.output)
+    print("Saved to", args.output)
+    return track
+
+
+def render(args):
+    from track.track import Track
+    track = Track.open(args.snapshot)
+    rendered = track.load(dir=args.dir, border=args.border, layer=args.layer, dpi=args.dpi, workers=args.workers,
+                          force=args.force)
+    print(len(rendered), "of", len(track), "pages rendered in", args.dir)
+    return track
+
+
+def export_kml(args):
+    from track.track import Track
+    track = Track.open(args.snapshot)
+    track.save_to_kml(args.output)
+    print("Saved to", args.output)
+    return track
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Split a GPS track into printable IGN map pages")
+    parser.add_argument("--report", help="write timings, counters and peak memory of the run to this JSON file")
+    parser.add_argument("--profile", help="write cProfile statistics of the run to this file")
+    commands = parser.add_subparsers(dest="command")
+    commands.required = True
+
+    def add_track_args(p):
+        p.add_argument("track", help="KML or GPX file")
+        p.add_argument("--max-points", type=int, default=None, help="only read the first points of the track")
+        p.add_argument("--format", choices=sorted(formats()), default="A4", help="page format")
+        p.add_argument("--zoom", type=int, default=ign.zoom.DEFAULT, help="IGN zoom level")
+        p.add_argument("--margin", type=float, default=0.5, help="page margin, in cm")
+        p.add_argument("--tolerance", type=float, default=0.5,
+                       help="drop points changing the drawn track by less than this many pixels (0 keeps all points)")
+
+    p = commands.add_parser("segment", help="split a track into pages and print the page count")
+    add_track_args(p)
+    p.set_defaults(func=segment)
+
+    p = commands.add_parser("process", help="segment a track, fetch profiles and cities, and save it")
+    add_track_args(p)
+    p.add_argument("-o", "--output", default="track.npz", help="snapshot file to write")
+    p.add_argument("-v", "--verbose", action="store_true", help="describe each segment")
+    p.set_defaults(func=process)
+
+    p = commands.add_parser("render", help="render the pages of a processed track")
+    p.add_argument("snapshot", help="file written by 'process'")
+    p.add_argument("--dir", default="./maps/", help="output directory")
+    p.add_argument("--dpi", type=int, default=150)
+    p.add_argument("--border", type=int, default=20, help="white border, in px")
+    p.add_argument("--layer", default=ign.layers.DEFAULT, help="IGN WMTS layer")
+    p.add_argument("--workers", type=int, default=1, help="number of rendering processes")
+    p.add_argument("--force", action="store_true", help="render every page, even unchanged ones")
+    p.set_defaults(func=render)
+
+    p = commands.add_parser("export-kml", help="export the page boxes of a processed track as KML")
+    p.add_argument("snapshot", help="file written by 'process'")
+    p.add_argument("output", help="KML file to write")
+    p.set_defaults(func=export_kml)
+
+    return parser
 
-fname = "../parcours_439080.kml"
 
-path, name = kml.read_track(fname, max_points=2000)
-print(name, "loaded,", len(path), "points found")
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.report is None and args.profile is None:
+        args.func(args)
+        return
 
-f = format.A4(150)
-print("Target size", f.px)
-tss = Track.from_path(path, verbose=True, format=f)
+    from utils import instrument
+    instrument.start(profile=args.profile)
+    try:
+        args.func(args)
+    finally:
+        report = instrument.stop()
+        if args.report is not None:
+            instrument.save(args.report, report)
+            print("Report saved to", args.report)
 
-print("\nTrack divided in", len(tss), "segments.")
 
-tss.load()
\ No newline at end of file
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -1,13 +1,18 @@
 from collections import namedtuple
 from xml.etree import ElementTree as ET
-import requests
 
 import geo
+import ign.http
 from geo import Point
 
 City = namedtuple("City", ["name", "dept"])
 
 OVERPASS_ENDPOINT = "http://www.overpass-api.de/api/xapi?node[bbox={w:.4f},{s:.4f},{e:.4f},{n:.4f}][place={place}]"
+OVERPASS_HOST = "www.overpass-api.de"
+PLACE_TYPES = ["village", "town", "city"] # ["village", "town", "suburb", "city"]
+
+# Public instance: be gentle
+ign.http.limit(OVERPASS_HOST, rate=1)
 
 
 def parse_file(fname):
@@ -34,7 +39,8 @@ def parse_xml(xml):
             ctable = {
                 "name": "name",
                 "population": "population",
-                "ref:INSEE": "zipcode"
+                "ref:INSEE": "zipcode",
+                "place": "type"
             }
             for data in node:
                 if data.tag == "tag":
@@ -50,24 +56,18 @@ def parse_xml(xml):
     return cities
 
 def build_query(bbox, place="village"):
+    """Fetch the nodes of the given place type(s) within `bbox`. Raise `requests.HTTPError` if Overpass fails"""
     w, e, s, n = bbox
     url = OVERPASS_ENDPOINT.format(w=w, e=e, s=s, n=n, place=place)
-    r = requests.get(url)
-    if r.status_code == 200:
-        return parse_string(r.content)
-    else:
-        print("ERROR")
-        return []
+    r = ign.http.get(url)
+    r.raise_for_status()
+    return parse_string(r.content)
 
-def get_places(bbox):
-    data = []
-    types = ["village", "town", "city"] # ["village", "town", "suburb", "city"]
-    for ptype in types:
-        d = build_query(bbox, place=ptype)
-        for locality in d:
-            locality["type"] = ptype
-            locality["dept"] = locality["zipcode"][:2]
-        data = data + d
+def get_places(bbox, types=PLACE_TYPES):
+    """Fetch all localities of the given types within `bbox`, in a single request"""
+    data = build_query(bbox, place="|".join(types))
+    for locality in data:
+        locality["dept"] = locality["zipcode"][:2]
     return data
 
 def rank(city, func):
@@ -0,0 +1,139 @@
+import heapq
+import itertools
+import math
+from collections import defaultdict
+
+import numpy as np
+
+import overpass.api
+
+DEFAULT_CELL = 0.05  # degrees
+LEAF_SIZE = 8
+EARTH_RADIUS = 6371.0088  # km
+# Maximum relative gap between the great circle distance (on a sphere of radius EARTH_RADIUS) and the WGS84 geodesic
+SPHERE_TOLERANCE = 0.01
+
+
+def to_unit_sphere(lon, lat):
+    """Cartesian coordinates on the unit sphere: chord length grows monotonically with great circle distance"""
+    lon, lat = np.radians(lon), np.radians(lat)
+    return np.stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)], axis=-1)
+
+
+def chord_to_km(chord):
+    return 2 * EARTH_RADIUS * math.asin(min(1., chord / 2))
+
+
+class KDTree:
+    """Static KD-tree over an (n, d) array of points, with best-first nearest neighbour iteration"""
+    def __init__(self, points):
+        self.points = np.asarray(points, dtype=np.float64)
+        self.root = self._build(np.arange(len(self.points))) if len(self.points) else None
+
+    def _build(self, idx):
+        pts = self.points[idx]
+        lo, hi = pts.min(axis=0), pts.max(axis=0)
+        if len(idx) <= LEAF_SIZE:
+            return lo, hi, idx, None, None
+        axis = int(np.argmax(hi - lo))
+        order = np.argsort(pts[:, axis], kind="mergesort")
+        mid = len(idx) // 2
+        return lo, hi, None, self._build(idx[order[:mid]]), self._build(idx[order[mid:]])
+
+    @staticmethod
+    def _box_distance(q, node):
+        lo, hi = node[0], node[1]
+        d = np.maximum(np.maximum(lo - q, q - hi), 0)
+        return float(np.sqrt(np.dot(d, d)))
+
+    def iter_nearest(self, q):
+        """Yield `(distance, index)` for every point, by increasing euclidean distance to `q`"""
+        if self.root is None:
+            return
+        q = np.asarray(q, dtype=np.float64)
+        counter = itertools.count()
+        heap = [(self._box_distance(q, self.root), next(counter), self.root)]
+        while heap:
+            d, _, item = heapq.heappop(heap)
+            if not isinstance(item, tuple):
+                yield d, item
+                continue
+            _, _, idx, left, right = item
+            if idx is not None:
+                dists = np.sqrt(((self.points[idx] - q) ** 2).sum(axis=1))
+                for di, i in zip(dists.tolist(), idx.tolist()):
+                    heapq.heappush(heap, (di, next(counter), i))
+            else:
+                for child in (left, right):
+                    heapq.heappush(heap, (self._box_distance(q, child), next(counter), child))
+
+    def query(self, q, k=1):
+        """Distances and indices of the `k` nearest points to `q`"""
+        return list(itertools.islice(self.iter_nearest(q), k))
+
+
+class PlaceIndex:
+    """
+    Localities bucketed on a regular lon/lat grid, to answer bounding box queries without scanning every place, and
+    stored in a KD-tree (on the unit sphere) for nearest place queries.
+
+    Build it once per track with `PlaceIndex.fetch`, then query each segment locally with `within` and `nearest`.
+    """
+    def __init__(self, places, cell=DEFAULT_CELL):
+        self.places = places
+        self.cell = cell
+        self.cells = defaultdict(list)
+        for i, place in enumerate(places):
+            self.cells[self._cell(*place["pos"])].append(i)
+        self.tree = KDTree(to_unit_sphere(
+            [place["pos"].lon for place in places],
+            [place["pos"].lat for place in places]
+        ).reshape(-1, 3))
+
+    @classmethod
+    def fetch(cls, bbox, cell=DEFAULT_CELL):
+        """Fetch all localities within `bbox` with a single Overpass request"""
+        return cls(overpass.api.get_places(bbox), cell=cell)
+
+    def _cell(self, lon, lat):
+        return math.floor(lon / self.cell), math.floor(lat / self.cell)
+
+    def within(self, bbox):
+        """All places inside `bbox` (a `geo.Bbox` or a (lon_min, lon_max, lat_min, lat_max) tuple), in index order"""
+        lon_min, lon_max, lat_min, lat_max = bbox
+        c0, r0 = self._cell(lon_min, lat_min)
+        c1, r1 = self._cell(lon_max, lat_max)
+        found = []
+        for c in range(c0, c1 + 1):
+            for r in range(r0, r1 + 1):
+                for i in self.cells.get((c, r), []):
+                    lon, lat = self.places[i]["pos"]
+                    if lon_min <= lon <= lon_max and lat_min <= lat <= lat_max:
+                        found.append(i)
+        return [self.places[i] for i in sorted(found)]
+
+    def nearest(self, point, k=1, bbox=None):
+        """
+        The `k` places closest to `point`, optionally restricted to those inside `bbox`.
+
+        Candidates come out of the KD-tree by increasing great circle distance, and are ranked exactly like
+        `overpass.api.rank_by_distance` (geodesic distance, then department and name). The search stops as soon as no
+        further candidate can beat the current k-th best, given `SPHERE_TOLERANCE`.
+        """
+        if bbox is not None:
+            lon_min, lon_max, lat_min, lat_max = bbox
+        best = []
+        for chord, i in self.tree.iter_nearest(to_unit_sphere(point.lon, point.lat)):
+            if len(best) >= k and chord_to_km(chord) * (1 - SPHERE_TOLERANCE) > best[k - 1][0][0]:
+                break
+            place = self.places[i]
+            if bbox is not None:
+                lon, lat = place["pos"]
+                if not (lon_min <= lon <= lon_max and lat_min <= lat <= lat_max):
+                    continue
+            best.append((overpass.api.rank_by_distance(place, point), i))
+            best.sort()
+        return [self.places[i] for _, i in best[:k]]
+
+    def __len__(self):
+        return len(self.places)
@@ -1,17 +1,26 @@
-import io
+import hashlib
+import json
 import math
 import os
 
-from PIL import Image
-from matplotlib import pyplot as plt
+import numpy as np
 
 import geo
 import ign
 from utils import kml
 import utils
 import overpass
+import overpass.index
 from overpass.api import City
 
+# Calibration of computed distances against the reference length of a known itinerary (1006 km), measured by chords
+# between every 10th fix (see `TrackSegment.distances`)
+DISTANCE_CORRECTION = 1006 / 1148.7498812128724
+
+# Bump whenever the rendering code changes, to invalidate images rendered by previous versions
+RENDER_VERSION = 5
+
+
 class TrackSegment:
     current = 0
 
@@ -36,19 +45,25 @@ class TrackSegment:
         self.altmin = None
         self.altmax = None
         self.main_city, self.from_city, self.to_city = None, None, None
-
-    def process(self, path):
-        # Compute distance
-        profile, dist, dpos, dneg = self.get_elevation(path)
-        # Compute profile
+        # Tiles missing from the last rendered image (blank), see `load_tile`
+        self.blank_tiles = 0
+        # Original indices (see `geo.TrackPath.original_index`) of the points of `profile`
+        self.profile_index = None
+
+    def process(self, path, places=None, profile=None):
+        # Compute profile & distance
+        with utils.instrument.span("process.elevation"):
+            profile, idx, dist, dpos, dneg = self.get_elevation(path, profile=profile)
         self.profile = profile
+        self.profile_index = idx
         self.distance = dist
         self.dpos = dpos
         self.dneg = dneg
-        self.altmin = min(profile[1])
-        self.altmax = max(profile[1])
+        self.altmin = float(profile[1].min())
+        self.altmax = float(profile[1].max())
         # Compute starting, ending & main cities
-        self.main_city, self.from_city, self.to_city = self.get_cities(path)
+        with utils.instrument.span("process.cities"):
+            self.main_city, self.from_city, self.to_city = self.get_cities(path, places)
 
     @property
     def name(self):
@@ -90,9 +105,12 @@ class TrackSegment:
         ]
         return sep.join(s)
 
-    def get_cities(self, path):
-        """Find all cities within bounding box"""
-        cities = overpass.api.get_places(self.box.expand(1, 1))
+    def get_cities(self, path, places=None):
+        """Find all cities within bounding box, either from `places` (an `overpass.index.PlaceIndex`) or from Overpass"""
+        box = self.box.expand(1, 1)
+        if places is None:
+            places = overpass.index.PlaceIndex(overpass.api.get_places(box))
+        cities = places.within(box)
         if not cities:
             unk = "unknown"
             return City(unk, "00"), City(unk, "00"), City(unk, "00")
@@ -100,40 +118,53 @@ class TrackSegment:
         ending_point = path[self.end]
 
         _, main_city_dept, main_city = max([overpass.api.rank_by_significance(city) for city in cities])
-        _, from_dept, from_city = min([overpass.api.rank_by_distance(city, starting_point) for city in cities])
-        _, to_dept, to_city = min([overpass.api.rank_by_distance(city, ending_point) for city in cities])
+        from_city = places.nearest(starting_point, bbox=box)[0]
+        to_city = places.nearest(ending_point, bbox=box)[0]
 
         main_ = City(main_city, main_city_dept)
-        from_ = City(from_city, from_dept)
-        to_ = City(to_city, to_dept)
+        from_ = City(from_city["name"], from_city["dept"])
+        to_ = City(to_city["name"], to_city["dept"])
         return main_, from_, to_
 
+    def original_range(self, path):
+        """Original indices of the first and last points of the segment"""
+        path = geo.TrackPath.from_points(path)
+        return int(path.original_index(self.start)), int(path.original_index(self.end))
+
+    @staticmethod
+    def distances(lon, lat):
+        """Cumulated distance (in km) along the points (lon, lat), the profile points (see `DISTANCE_CORRECTION`)"""
+        return DISTANCE_CORRECTION * geo.distance.cumulative(lon, lat)
+
     def cum_distance(self, path, step=10):
-        """Compute cumulated distance at each point from `self.start` to `self.end`"""
-        cumdist = 0
-        dists = []
-        f = 1006 / 1148.7498812128724
-        i = self.start
-        for j in range(self.start, self.end, step):
-            cumdist += f * geo.Point.distance(path[i], path[j])
-            i = j
-            dists.append(cumdist)
-        return dists
+        """Compute cumulated distance every `step` original points from `self.start` to `self.end`"""
+        path = geo.TrackPath.from_points(path)
+        return self.distances(*path.at_index(self.sample_points(path, step))).tolist()
 
     def get_distance(self, path):
         """Compute total length of the path between `self.start` and `self.end`"""
         return self.cum_distance(path)[-1]
 
-    def get_elevation(self, path, step=10):
-        """Compute the vertical profile of the track between `self.start` and `self.end`"""
-        lon = [path[i].lon for i in range(self.start, self.end, step)]
-        lat = [path[i].lat for i in range(self.start, self.end, step)]
+    def sample_points(self, path, step=10):
+        """Original indices of the elevation samples: every `step` original points, and both ends of the segment"""
+        start, end = self.original_range(path)
+        return np.union1d(np.arange(start, end, step), [start, end])
+
+    def get_elevation(self, path, step=10, profile=None):
+        """Vertical profile between `self.start` and `self.end`, sliced from the track's `profile` if given"""
+        path = geo.TrackPath.from_points(path)
+        if profile is None:
+            idx = self.sample_points(path, step)
+            lon, lat = path.at_index(idx)
+            elevations = ign.api.get_elevation(lon.tolist(), lat.tolist())
+            profile = idx, self.distances(lon, lat), np.asarray(elevations, dtype=np.float64)
+        idx, dists, elevations = profile
+        start, end = self.original_range(path)
+        a, b = np.searchsorted(idx, [start, end + 1])
+        idx, dists, elevations = idx[a:b], dists[a:b] - dists[a], elevations[a:b]
 
-        elevations = ign.api.get_elevation(lon, lat)
         dpos, dneg = geo.utils.denivele(elevations)
-        cumdist = self.cum_distance(path, step)
-        dist = cumdist[-1]
-        return (cumdist, elevations), dist, dpos, dneg
+        return (dists, elevations), idx, float(dists[-1]), dpos, dneg
 
     def to_kml(self):
         """Return a KML Placemark representing the segment"""
@@ -206,7 +237,25 @@ class TrackSegment:
         self.coords = (c0, r0, c1, r1)
         return c0, r0, c1, r1
 
-    def load_tile(self, layer, level):
+    def plan_tiles(self, level, size=None):
+        """Tiles of the mosaic visible once cropped to `size` (see `utils.image.crop`), or all if `size` is None"""
+        c0, r0, c1, r1 = self.coords
+        mat = ign.api.tile_matrix(level)
+        tile_height, tile_width = mat.tileheight, mat.tilewidth
+        width = tile_width * (c1 - c0)
+        height = tile_height * (r1 - r0)
+
+        if size is None:
+            x0, y0, x1, y1 = 0, 0, width, height
+        else:
+            x0, y0, x1, y1 = utils.image.crop_box((width, height), size)
+            x0, y0, x1, y1 = max(x0, 0), max(y0, 0), min(x1, width), min(y1, height)
+        rows = range(r0 + y0 // tile_height, r0 + math.ceil(y1 / tile_height))
+        cols = range(c0 + x0 // tile_width, c0 + math.ceil(x1 / tile_width))
+        return [(col, row) for row in rows for col in cols]
+
+    def load_tile(self, layer, level, size=None):
+        from PIL import Image
         c0, r0, c1, r1 = self.coords
         mat = ign.api.tile_matrix(level)
         tile_height, tile_width = mat.tileheight, mat.tilewidth
@@ -214,97 +263,72 @@ class TrackSegment:
         height = tile_height * (r1 - r0)
 
         tile = Image.new("RGB", (width, height))
-        for rownum, row in enumerate(range(r0, r1 + 1)):
-            for colnum, col in enumerate(range(c0, c1 + 1)):
-                im = ign.api.get_tile(col, row, layer, level)
-                tile.paste(im=im, box=(colnum * tile_width, rownum * tile_height))
-            #print("Row {} done.".format(rownum))
-        return tile
+        coords = self.plan_tiles(level, size)
+        # Compared with the tiles of range(r0, r1 + 1) x range(c0, c1 + 1), all fetched before tiles were planned
+        utils.instrument.count("tiles.planned", len(coords))
+        utils.instrument.count("tiles.skipped", (r1 - r0 + 1) * (c1 - c0 + 1) - len(coords))
+        blank = 0
+        for (col, row), im in ign.api.get_tiles(coords, layer, level):
+            if im is None:
+                blank += 1  # left blank on the canvas
+                continue
+            tile.paste(im=im, box=((col - c0) * tile_width, (row - r0) * tile_height))
+        return tile, blank
 
     def build_legend(self, size, dpi, max_diff=1000):
-        w_in = size[0] / dpi
-        h_in = size[1] / dpi
         x, z = self.profile
+        return utils.plot.render_profile(x, z, self.name, self.statistics, size, dpi, max_diff)
 
-        # Init figure
-        fig = plt.figure(figsize=(w_in, h_in), dpi=dpi)
-
-        # Set axes and grid
-        axes = plt.gca()
-        z_min, z_max = utils.plot.set_axes(x, z, axes, max_diff)
-        utils.plot.set_grid(axes)
-
-        # Plot data
-        plt.plot(x, z)
-        plt.fill_between(x, z, z_min, alpha=0.2)
-        plt.vlines(*utils.plot.get_vlines(x, z, z_min))
-
-        # Add legend
-        # TODO : improve text display to avoid overlap or oversize
-        plt.text(0, 1, self.name, fontsize=12, fontweight="semibold", transform=axes.transAxes)
-        plt.text(0, 0.92, self.statistics, fontsize=11, transform=axes.transAxes)
+    def get_imcoords_converter(self, size, level):
+        scale_x, scale_y, x0, y0 = self._imcoords_transform(size, level)
 
-        buffer = io.BytesIO()
-        fig.savefig(buffer, transparent=False, bbox_inches="tight", dpi=dpi, edgecolor="k")
-        buffer.seek(0)
-        plt.close()
-        im = Image.open(buffer)
-        im.load()
-        return im
+        def convert(p):
+            x, y = p.as_mercator()
+            return scale_x * (x - x0), scale_y * (y - y0)
+        return convert
 
-    def get_imcoords_converter(self, size, level):
+    def _imcoords_transform(self, size, level):
         c0, r0, c1, r1 = self.coords
         w, h = size
 
         x0, y0 = ign.api.reverse_coords(c0, r0, level)
         x1, y1 = ign.api.reverse_coords(c1, r1, level)
+        return w / (x1 - x0), h / (y1 - y0), x0, y0
 
-        def convert(p):
-            x, y = p.as_mercator()
-            x = w * (x - x0) / (x1 - x0)
-            y = h * (y - y0) / (y1 - y0)
-            return x, y
-        return convert
+    def to_imcoords(self, path, size, level):
+        """Image coordinates of every point of `path`, using its cached Mercator projection"""
+        x, y = geo.TrackPath.from_points(path).mercator()
+        return self.mercator_to_imcoords(x, y, size, level)
+
+    def mercator_to_imcoords(self, x, y, size, level):
+        scale_x, scale_y, x0, y0 = self._imcoords_transform(size, level)
+        return scale_x * (x - x0), scale_y * (y - y0)
 
-    def get_track_line(self, path, level, size, step=5):
+    def get_track_line(self, path, level, size, step=5, tolerance=1.):
+        """Visible runs of the track, clipped and simplified in image coordinates, and ticks every `step` km"""
         w, h = size
-        convert = self.get_imcoords_converter(size, level)
-
-        line = []
-
-        # First, go backward from starting point
-        curr = self.start
-        x, y = convert(path[curr])
-        while curr >= 0 and x > 0 and y > 0:
-            line.append((x, y))
-            curr -= 1
-            x, y = convert(path[curr])
-        line = list(reversed(line))
-
-        # Then, go forward till the end
-        i_start = len(line)
-        curr = self.start
-        x, y = convert(path[curr])
-        while x < w and y < h and curr < len(path) - 1:
-            line.append((x, y))
-            curr += 1
-            x, y = convert(path[curr])
-
-        # Now, mark points every `step` kilometers
-        ticks = [0]
-        smooth = 10
-        dists = self.profile[0]
-        for i in range(1, len(dists)):
-            if math.floor(dists[i - 1]) // step != math.floor(dists[i]) // step:
-                ticks.append(i * smooth)
-
-        ticks = [line[tick + i_start] for tick in ticks]
-
-        return line, ticks
-
-    def find_legend_pos(self, line, lsize, imsize):
+        xs, ys = self.to_imcoords(path, size, level)
+
+        lines = []
+        # Clip the whole path, so that parts leaving and re-entering the page are all drawn
+        for x, y in geo.polyline.clip(xs, ys, (0, 0, w, h)):
+            keep = geo.polyline.simplify(x, y, tolerance)
+            lines.append(list(zip(x[keep].tolist(), y[keep].tolist())))
+
+        # Now, mark the first profile point of every `step` kilometers
+        section = np.floor(self.profile[0]) // step
+        ticks = np.concatenate([[0], np.flatnonzero(np.diff(section)) + 1]).astype(np.intp)
+        x, y = geo.utils.to_mercator(*geo.TrackPath.from_points(path).at_index(np.asarray(self.profile_index)[ticks]))
+        x, y = self.mercator_to_imcoords(x, y, size, level)
+        ticks = list(zip(x.tolist(), y.tolist()))
+
+        return lines, ticks
+
+    def find_legend_pos(self, points, lsize, imsize):
+        """Corner of the image hiding the fewest track points, `points` being a pair of arrays (x, y)"""
         lw, lh = lsize
         w, h = imsize
+        xs, ys = points
 
         corners = {
             "topleft": (0, 0, lw, lh),
@@ -312,50 +336,89 @@ class TrackSegment:
             "bottomright": (w-lw, h-lh, w, h),
             "bottomleft": (0, h-lh, lw, h)
         }
-        hidden_points = {corner: 0 for corner in corners}
-
-        def is_in(point, corner):
-            x, y = point
-            x0, y0, x1, y1 = corners[corner]
-            return x0 <= x <= x1 and y0 <= y <= y1
-        for point in line:
-            for corner in corners:
-                if is_in(point, corner):
-                    hidden_points[corner] += 1
+        hidden_points = {}
+        for corner, (x0, y0, x1, y1) in corners.items():
+            hidden_points[corner] = int(np.count_nonzero((xs >= x0) & (xs <= x1) & (ys >= y0) & (ys <= y1)))
 
         _, best_corner = min([(n_hidden, corner) for corner, n_hidden in hidden_points.items()])
         return best_corner
 
+    def image_file(self, dir):
+        return dir + self.encoded_name + ".jpg"
+
+    def map_size(self, border, format):
+        """Size of the map on the page, in pixels"""
+        w, h = format.px
+        return w - 2*border, h - 2*border
+
+    def render_key(self, path, border, layer, level, format):
+        """Hash of everything the rendered image depends on: renders with the same key give the same image"""
+        path = geo.TrackPath.from_points(path)
+        # Same window as `load`: every point of the mosaic can be drawn, or move the legend (see `find_legend_pos`)
+        c0, r0, c1, r1 = self.find_coords(self.map_size(border, format), level)
+        x0, y0 = ign.api.reverse_coords(c0, r0, level)
+        x1, y1 = ign.api.reverse_coords(c1, r1, level)
+        x, y = path.mercator()
+        inside = (x >= x0) & (x <= x1) & (y >= y1) & (y <= y0)
+        # Segments crossing the mosaic are drawn too, even when both their ends are outside
+        crossing = ((np.maximum(x[:-1], x[1:]) >= x0) & (np.minimum(x[:-1], x[1:]) <= x1)
+                    & (np.maximum(y[:-1], y[1:]) >= y1) & (np.minimum(y[:-1], y[1:]) <= y0))
+        inside[:-1] |= crossing
+        inside[1:] |= crossing
+        visible = np.flatnonzero(inside)
+        params = {
+            "version": RENDER_VERSION,
+            "range": [self.start, self.end],
+            "box": list(self.box.box),
+            "name": self.name,
+            "statistics": self.statistics,
+            "layer": layer,
+            "level": level,
+            "format": [format.w, format.h, format.dpi],
+            "border": border,
+            "style": [list(utils.image.DEFAULT_COLOR), utils.image.DEFAULT_LINE_WIDTH]
+        }
+        h = hashlib.sha1(json.dumps(params, sort_keys=True, default=lambda v: v.item()).encode("utf-8"))
+        h.update(visible.astype(np.int64).tobytes())
+        h.update(path.lon[visible].tobytes())
+        h.update(path.lat[visible].tobytes())
+        if self.profile is not None:
+            h.update(np.asarray(self.profile, dtype=np.float64).tobytes())
+        return h.hexdigest()
+
     def load(self, path, dir, border, layer, level, format):
         # TODO : load should take a shape argument (in px) and a border argument, and Track should handle the conversion paper size <-> pixel size
-        w, h = format.px
-        w = w - 2*border
-        h = h - 2*border
+        w, h = self.map_size(border, format)
         lw = math.floor(w * (960/1832))
         lh = math.floor(lw * (5 / 12))
 
         # Load tile
         self.find_coords((w, h), level)
-        tile = self.load_tile(layer, level)
+        with utils.instrument.span("render.tiles"):
+            tile, self.blank_tiles = self.load_tile(layer, level, size=(w, h))
 
         # Draw track and ticks
-        line, ticks = self.get_track_line(path, level, size=tile.size)
-        lpos = self.find_legend_pos(line, lsize=(lw, lh), imsize=tile.size)
-        tile = utils.image.draw(tile, line=line, points=ticks)
-        tile = utils.image.crop(tile, size=(w, h))
+        with utils.instrument.span("render.track_line"):
+            lines, ticks = self.get_track_line(path, level, size=tile.size)
+            lpos = self.find_legend_pos(self.to_imcoords(path, tile.size, level), lsize=(lw, lh), imsize=tile.size)
+        with utils.instrument.span("render.draw"):
+            tile = utils.image.draw(tile, lines=lines, points=ticks)
+            tile = utils.image.crop(tile, size=(w, h))
 
         # Load legend
-        legend = self.build_legend(size=(lw, lh), dpi=format.dpi)
-
-        # Merge both
-        image = utils.image.merge(tile, legend, lpos)
+        with utils.instrument.span("render.legend"):
+            legend = self.build_legend(size=(lw, lh), dpi=format.dpi)
 
-        # Add border
-        image = utils.image.add_border(image, border=border)
+        # Merge both, and add border
+        with utils.instrument.span("render.merge"):
+            image = utils.image.merge(tile, legend, lpos)
+            image = utils.image.add_border(image, border=border)
 
         # Save
         if not os.path.exists(dir):
             os.makedirs(dir, exist_ok=True)
-        image.save(dir + self.encoded_name + ".jpg")
+        with utils.instrument.span("render.save"):
+            image.save(self.image_file(dir))
+        utils.instrument.count("render.pages")
 
         return image
\ No newline at end of file
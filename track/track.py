@@ -1,9 +1,38 @@
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+
 import format
 import geo
 import ign
+import overpass.index
+import utils.instrument
+from overpass.api import City
 from utils import kml
 from track.segment import TrackSegment
 
+# Version of the format written by `Track.save`
+SNAPSHOT_VERSION = 2
+# File, in the output directory, mapping each rendered image to the hash of its inputs
+MANIFEST = "manifest.json"
+
+# Path shared by all segments rendered in a worker process, see `Track.load`
+_worker_path = None
+
+
+def _init_worker(path):
+    global _worker_path
+    _worker_path = path
+
+
+def _load_segment(segment, dir, border, layer, level, format):
+    """Render `segment` in a worker process, and return the attributes set by rendering, to update the parent's copy"""
+    segment.load(_worker_path, dir, border, layer, level, format)
+    return segment.coords, segment.blank_tiles
+
+
 class Track:
     def __init__(self, segments, path, format, zoom, margin):
         self.segments = segments
@@ -15,46 +44,140 @@ class Track:
         self.descr = ""
 
     @classmethod
-    def from_path(cls, path, format=format.A4, zoom=ign.zoom.DEFAULT, margin=0.5, verbose=False):
+    def from_path(cls, path, format=format.A4, zoom=ign.zoom.DEFAULT, margin=0.5, verbose=False, process=True,
+                  tolerance=0):
+        """Split `path` into pages, decimated to `tolerance` pixels if given, and process them unless told not to"""
+        path = geo.TrackPath.from_points(path)
         curr = 0
         segments = []
-        while curr < len(path):
-            bbox, raw_bbox, start, curr = cls.segmentize(path, curr, format, zoom, margin)
-            end = min(curr, len(path) - 1)
-            segment_id = len(segments)
-            # Find mercator coords here
-            ts = TrackSegment(bbox, start=start, end=end, sid=segment_id, raw_bbox=raw_bbox)
-            ts.process(path)
+        with utils.instrument.span("segmentize"):
+            while curr < len(path):
+                bbox, raw_bbox, start, curr = cls.segmentize(path, curr, format, zoom, margin)
+                end = min(curr, len(path) - 1)
+                segment_id = len(segments)
+                # Find mercator coords here
+                ts = TrackSegment(bbox, start=start, end=end, sid=segment_id, raw_bbox=raw_bbox)
+                segments.append(ts)
+        utils.instrument.count("segments", len(segments))
+
+        if tolerance > 0 and segments:
+            with utils.instrument.span("decimate"):
+                bounds = [i for ts in segments for i in (ts.start, ts.end)]
+                decimated = path.decimate(tolerance * ign.levels[zoom].res, keep=bounds)
+                # Boundaries are kept, so they have an exact position in the decimated path
+                kept = np.searchsorted(decimated.index, path.original_index(np.asarray(bounds)))
+                for ts, (start, end) in zip(segments, kept.reshape(-1, 2).tolist()):
+                    ts.start, ts.end = start, end
+            utils.instrument.count("points.decimated", len(path) - len(decimated))
+            path = decimated
+
+        track = cls(segments, path, format, zoom, margin)
+        if process:
+            track.process(verbose=verbose)
+        return track
+
+    def process(self, verbose=False):
+        """Compute the profile, statistics and cities of every segment, from localities and elevations fetched at once"""
+        def timed(name, fetch):
+            with utils.instrument.span(name):
+                return fetch()
+
+        # Both requests wait on the network: send them together
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            places = executor.submit(timed, "process.places", lambda: self.fetch_places(self.segments))
+            profile = executor.submit(timed, "process.profile", self.get_profile)
+            places, profile = places.result(), profile.result()
+        for ts in self.segments:
+            ts.process(self.path, places=places, profile=profile)
             if verbose:
                 print(ts)
-            segments.append(ts)
 
-        return cls(segments, path, format, zoom, margin)
+    def sample_points(self, step=10):
+        """Original indices of the profile points: every `step` original points, and both ends of each segment"""
+        path = geo.TrackPath.from_points(self.path)
+        bounds = [ts.original_range(path) for ts in self.segments]
+        return np.union1d(np.arange(0, path.original_length, step), np.asarray(bounds, dtype=np.intp).ravel())
+
+    def get_profile(self, step=10):
+        """Original indices, cumulated distances and elevations of the profile points, sliced by each segment"""
+        idx = self.sample_points(step)
+        lon, lat = geo.TrackPath.from_points(self.path).at_index(idx)
+        elevations = ign.api.get_elevation(lon.tolist(), lat.tolist())
+        return idx, TrackSegment.distances(lon, lat), np.asarray(elevations, dtype=np.float64)
+
+    @classmethod
+    def fetch_places(cls, segments):
+        """Fetch the localities of all segments at once, within the envelope of their (expanded) bounding boxes"""
+        corners = []
+        for ts in segments:
+            box = ts.box.expand(1, 1)
+            corners += [box.northwest, box.southeast]
+        return overpass.index.PlaceIndex.fetch(geo.Bbox.from_points(corners))
 
     @classmethod
     def segmentize(cls, path, start, format, zoom, margin):
         w, h = format.cm
         w, h, m = ign.levels[zoom].rescale(w, h, margin, unit="cm", to="km")
 
-        curr = start
-        box = geo.Bbox()
         b_max, b_min = max(w, h) - m, min(w, h) - m
-        while curr < len(path) and (box & path[curr]) < (b_max, b_min):
-            box.add(path[curr])
-            curr += 1
+        path = geo.TrackPath.from_points(path)
+        curr = geo.segmentation.find_end(path.lon, path.lat, start, b_max, b_min)
 
-        raw_bbox = box
-        bbox = box.expand_to((w, h))
+        raw_bbox = path.bbox(start, curr)
+        bbox = raw_bbox.expand_to((w, h))
         return bbox, raw_bbox, start, curr
 
-    def load(self, dir="./maps/", border=20, layer=ign.layers.DEFAULT, dpi=None):
+    def load(self, dir="./maps/", border=20, layer=ign.layers.DEFAULT, dpi=None, workers=1, force=False):
+        """Render the pages changed since the last run in `dir` (all of them with `force`), in `workers` processes"""
         if dpi is not None:
             self.format.dpi = dpi
         elif self.format.dpi is None:
             self.format.dpi = 72
 
+        manifest = {} if force else self.read_manifest(dir)
+        todo = []
         for segment in self.segments:
-            segment.load(self.path, dir, border, layer, self.zoom, self.format)
+            fname = segment.image_file(dir)
+            key = segment.render_key(self.path, border, layer, self.zoom, self.format)
+            if manifest.get(os.path.basename(fname)) != key or not os.path.exists(fname):
+                todo.append(segment)
+            manifest[os.path.basename(fname)] = key
+
+        if workers is None or workers <= 1:
+            for segment in todo:
+                segment.load(self.path, dir, border, layer, self.zoom, self.format)
+        elif todo:
+            # Project once here rather than in every worker
+            path = geo.TrackPath.from_points(self.path)
+            path.mercator()
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(path,)) as executor:
+                futures = [
+                    executor.submit(_load_segment, segment, dir, border, layer, self.zoom, self.format)
+                    for segment in todo
+                ]
+                for segment, future in zip(todo, futures):
+                    segment.coords, segment.blank_tiles = future.result()
+
+        # Pages with missing tiles are rendered again next time
+        for segment in todo:
+            if segment.blank_tiles:
+                del manifest[os.path.basename(segment.image_file(dir))]
+        self.write_manifest(dir, manifest)
+        return todo
+
+    @staticmethod
+    def read_manifest(dir):
+        fname = os.path.join(dir, MANIFEST)
+        if not os.path.exists(fname):
+            return {}
+        with open(fname, "rt", encoding="utf-8") as f:
+            return json.load(f)
+
+    @staticmethod
+    def write_manifest(dir, manifest):
+        os.makedirs(dir, exist_ok=True)
+        with open(os.path.join(dir, MANIFEST), "wt", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=1, sort_keys=True)
 
     def save_to_kml(self, fname):
         shapes = [segment.to_kml() for segment in self]
@@ -63,12 +186,118 @@ class Track:
             f.write(k.to_string())
 
     def save(self, fname):
-        # TODO : add support for serialization
-        pass
+        """Save the processed track to a `.npz` snapshot, that `Track.open` reads back without any network access"""
+        path = geo.TrackPath.from_points(self.path)
+        segments = []
+        profile_x, profile_z, profile_index, offsets = [], [], [], [0]
+        for segment in self.segments:
+            city = lambda c: None if c is None else list(c)
+            segments.append({
+                "id": segment.id,
+                "start": segment.start,
+                "end": segment.end,
+                "box": list(segment.box.box),
+                "raw_box": list(segment.raw_bbox.box),
+                "coords": None if segment.coords is None else list(segment.coords),
+                "name": segment._name,
+                "descr": segment._descr,
+                "distance": segment.distance,
+                "dpos": segment.dpos,
+                "dneg": segment.dneg,
+                "altmin": segment.altmin,
+                "altmax": segment.altmax,
+                "main_city": city(segment.main_city),
+                "from_city": city(segment.from_city),
+                "to_city": city(segment.to_city),
+                "processed": segment.profile is not None
+            })
+            if segment.profile is not None:
+                x, z = segment.profile
+                profile_x += list(x)
+                profile_z += list(z)
+                profile_index += list(segment.profile_index)
+            offsets.append(len(profile_x))
+
+        header = {
+            "version": SNAPSHOT_VERSION,
+            "name": self.name,
+            "descr": self.descr,
+            "format": {"inch": list(self.format.inch), "name": self.format.name, "dpi": self.format.dpi},
+            "zoom": self.zoom,
+            "margin": self.margin,
+            "segments": segments
+        }
+        arrays = {
+            "header": np.frombuffer(json.dumps(header, default=lambda v: v.item()).encode("utf-8"), dtype=np.uint8),
+            "lon": path.lon,
+            "lat": path.lat,
+            "profile_x": np.asarray(profile_x, dtype=np.float64),
+            "profile_z": np.asarray(profile_z, dtype=np.float64),
+            "profile_index": np.asarray(profile_index, dtype=np.int64),
+            "profile_offsets": np.asarray(offsets, dtype=np.int64)
+        }
+        if path.alt is not None:
+            arrays["alt"] = path.alt
+        if path.time is not None:
+            arrays["time"] = path.time
+        if path.index is not None:
+            arrays["index"] = path.index
+        with open(fname, "wb") as f:
+            np.savez(f, **arrays)
+
+    @classmethod
+    def open(cls, fname):
+        """Load a track saved with `Track.save`"""
+        with np.load(fname, allow_pickle=False) as data:
+            header = json.loads(data["header"].tobytes().decode("utf-8"))
+            if header.get("version") != SNAPSHOT_VERSION:
+                raise ValueError("Unsupported track snapshot version {} in '{}' (expected {})".format(
+                    header.get("version"), fname, SNAPSHOT_VERSION))
+            path = geo.TrackPath(
+                data["lon"],
+                data["lat"],
+                alt=data["alt"] if "alt" in data else None,
+                time=data["time"] if "time" in data else None
+            )
+            if "index" in data:
+                path.index = data["index"]
+            profile_x = data["profile_x"].tolist()
+            profile_z = data["profile_z"].tolist()
+            profile_index = data["profile_index"]
+            offsets = data["profile_offsets"].tolist()
+
+        segments = []
+        for i, s in enumerate(header["segments"]):
+            ts = TrackSegment(
+                geo.Bbox(*s["box"]),
+                start=s["start"],
+                end=s["end"],
+                sid=s["id"],
+                raw_bbox=geo.Bbox(*s["raw_box"]),
+                name=s["name"],
+                coords=None if s["coords"] is None else tuple(s["coords"]),
+                descr=s["descr"]
+            )
+            if s["processed"]:
+                ts.profile = (profile_x[offsets[i]:offsets[i + 1]], profile_z[offsets[i]:offsets[i + 1]])
+                ts.profile_index = profile_index[offsets[i]:offsets[i + 1]]
+            for attr in ["distance", "dpos", "dneg", "altmin", "altmax"]:
+                setattr(ts, attr, s[attr])
+            city = lambda c: None if c is None else City(*c)
+            ts.main_city, ts.from_city, ts.to_city = city(s["main_city"]), city(s["from_city"]), city(s["to_city"])
+            segments.append(ts)
 
-    def open(self, fname):
-        # TODO : add support for deserialization
-        pass
+        f = header["format"]
+        track = cls(
+            segments,
+            path,
+            format.Format(inch=tuple(f["inch"]), name=f["name"], dpi=f["dpi"]),
+            header["zoom"],
+            header["margin"]
+        )
+        track.name = header["name"]
+        track.descr = header["descr"]
+        return track
 
     def __getitem__(self, item):
         return self.segments[item]
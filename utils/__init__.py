@@ -1,2 +1,9 @@
-import utils.image as image
-import utils.plot as plot
\ No newline at end of file
+import importlib
+
+# Submodules depending on PIL and matplotlib are only imported on first access
+_LAZY_SUBMODULES = {"image", "instrument", "kml", "plot"}
+
+def __getattr__(name):
+    if name in _LAZY_SUBMODULES:
+        return importlib.import_module("utils." + name)
+    raise AttributeError("module 'utils' has no attribute '{}'".format(name))
\ No newline at end of file
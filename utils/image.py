@@ -1,22 +1,25 @@
 import math
+from functools import lru_cache
 from PIL import Image, ImageDraw, ImageFont
 
 DEFAULT_COLOR = (56, 201, 255, 100)
 DEFAULT_LINE_WIDTH = 12
 
+def crop_box(imsize, size):
+    """Centered window (left, top, right, bottom) kept by `crop` on an image of size `imsize`"""
+    w, h = size
+    width, height = imsize
+    if width > height:
+        h, w = w, h
+    dh = math.floor((height - h) / 2)
+    dw = math.floor((width - w) / 2)
+    return dw, dh, width - dw, height - dh
+
 def crop(im, size=None):
     if size is None:
         return im
     else:
-        w, h = size
-        width, height = im.size
-        if width > height:
-            h, w = w, h
-        # print("Cropping from {} to {}".format(im.size, (w, h)))
-        dh = math.floor((height - h) / 2)
-        dw = math.floor((width - w) / 2)
-
-        return im.crop((dw, dh, width - dw, height - dh))
+        return im.crop(crop_box(im.size, size))
 
 def add_border(im, border=None, color="white"):
     if border is None:
@@ -38,13 +41,32 @@ def draw_line(im, line, color=DEFAULT_COLOR, lwidth=DEFAULT_LINE_WIDTH):
     draw.line(line, color, lwidth)
     return im
 
+@lru_cache(maxsize=None)
+def load_font(font_size):
+    """Arial at `font_size`, or Pillow's default font where Arial isn't installed (e.g. most Linux systems)"""
+    try:
+        return ImageFont.truetype("arial.ttf", font_size)
+    except OSError:
+        pass
+    try:
+        return ImageFont.load_default(font_size)
+    except TypeError:  # Pillow < 10.1: fixed-size bitmap font only
+        return ImageFont.load_default()
+
+def text_size(font, text):
+    """Width & height of `text`: `getsize` was removed in Pillow 10, `getbbox` only exists since Pillow 8"""
+    if hasattr(font, "getbbox"):
+        x0, y0, x1, y1 = font.getbbox(text)
+        return x1, y1
+    return font.getsize(text)
+
 def draw_points(im, points, color=DEFAULT_COLOR, font_size=15, step=5):
-    font = ImageFont.truetype("arial.ttf", font_size)
+    font = load_font(font_size)
     draw = ImageDraw.Draw(im, "RGBA")
 
     for i, tick in enumerate(points):
         x, y = tick
-        w, h = font.getsize(str(i * step))
+        w, h = text_size(font, str(i * step))
         padding = 4
         x_center, y_center = (x + 0.5 * w, y + 0.5 * h)
         d = max(w, h) / 2 + padding
@@ -53,8 +75,9 @@ def draw_points(im, points, color=DEFAULT_COLOR, font_size=15, step=5):
         draw.text(tick, str(i * step), fill="black", font=font)
     return im
 
-def draw(im, line=[], points=[], color=DEFAULT_COLOR, font_size=15, step=5, lwidth=DEFAULT_LINE_WIDTH):
-    im = draw_line(im, line, color=color, lwidth=lwidth)
+def draw(im, line=[], points=[], color=DEFAULT_COLOR, font_size=15, step=5, lwidth=DEFAULT_LINE_WIDTH, lines=[]):
+    for l in [line] + list(lines):
+        im = draw_line(im, l, color=color, lwidth=lwidth)
     im = draw_points(im, points, color=color, font_size=font_size, step=step)
     return im
 
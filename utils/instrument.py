@@ -0,0 +1,159 @@
+"""
+Lightweight instrumentation of processing & rendering: named spans (timers), counters and peak memory.
+
+    utils.instrument.start(profile="run.prof")   # optional cProfile dump
+    ...
+    with utils.instrument.span("render.tiles"):
+        ...
+    utils.instrument.count("tiles.fetched")
+    ...
+    report = utils.instrument.stop()              # also see `save`
+
+Disabled by default: `span` then returns a shared no-op context manager and `count` returns immediately, so leaving
+calls in hot code costs about a function call. Spans and counters are aggregated by name across threads. Work done in
+other processes (`Track.load` with `workers > 1`) is not recorded.
+"""
+import contextlib
+import json
+import sys
+import threading
+import time
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+enabled = False
+
+_NULL_SPAN = contextlib.nullcontext()
+_lock = threading.Lock()
+_spans = {}
+_counters = {}
+_peak_rss = 0
+_started = None
+_profiler = None
+_profile_file = None
+
+
+def peak_rss():
+    """Peak resident memory of the process so far, in kB (None if unknown)"""
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class _Span:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        global _peak_rss
+        elapsed = time.perf_counter() - self.start
+        rss = peak_rss()
+        with _lock:
+            entry = _spans.get(self.name)
+            if entry is None:
+                entry = _spans[self.name] = [0, 0., 0.]
+            entry[0] += 1
+            entry[1] += elapsed
+            entry[2] = max(entry[2], elapsed)
+            if rss is not None and rss > _peak_rss:
+                _peak_rss = rss
+        return False
+
+
+def span(name):
+    """Context manager timing the enclosed block under `name`"""
+    if not enabled:
+        return _NULL_SPAN
+    return _Span(name)
+
+
+def count(name, n=1):
+    """Add `n` to the counter `name`"""
+    if not enabled:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + n
+
+
+def reset():
+    global _peak_rss, _started
+    with _lock:
+        _spans.clear()
+        _counters.clear()
+        _peak_rss = 0
+        _started = time.perf_counter()
+
+
+def start(profile=None):
+    """Start recording (from scratch). With `profile`, also run cProfile and dump its stats to that file on `stop`"""
+    global enabled, _profiler, _profile_file
+    reset()
+    if "ign.http" in sys.modules:
+        sys.modules["ign.http"].reset_stats()
+    if "ign.api" in sys.modules:
+        api = sys.modules["ign.api"]
+        api.tile_cache.reset_stats()
+        cache = getattr(api.elevation_source, "cache", None)
+        if cache is not None:
+            cache.reset_stats()
+    if profile is not None:
+        import cProfile
+        _profiler = cProfile.Profile()
+        _profile_file = profile
+        _profiler.enable()
+    enabled = True
+
+
+def stop():
+    """Stop recording and return the report"""
+    global enabled, _profiler
+    enabled = False
+    if _profiler is not None:
+        _profiler.disable()
+        _profiler.dump_stats(_profile_file)
+        _profiler = None
+    return report()
+
+
+def report():
+    """
+    Everything recorded since `start`: spans (calls, total and max seconds), counters, peak memory, and the counters of
+    the HTTP transport and caches that were used (reset by `start`).
+    """
+    with _lock:
+        data = {
+            "wall_time": None if _started is None else time.perf_counter() - _started,
+            "peak_rss_kb": max(_peak_rss, peak_rss() or 0) if resource is not None else None,
+            "spans": {
+                name: {"calls": calls, "total": total, "max": longest}
+                for name, (calls, total, longest) in sorted(_spans.items())
+            },
+            "counters": dict(sorted(_counters.items()))
+        }
+    # Only report on modules that were actually used, without importing anything
+    if "ign.http" in sys.modules:
+        data["http"] = sys.modules["ign.http"].stats()
+    if "ign.api" in sys.modules:
+        api = sys.modules["ign.api"]
+        data["tile_cache"] = api.tile_cache.stats
+        cache = getattr(api.elevation_source, "cache", None)
+        if cache is not None and cache.hits + cache.misses:
+            data["elevation_cache"] = cache.stats
+    return data
+
+
+def save(fname, data=None):
+    """Write `data` (by default, the current report) to `fname` as JSON"""
+    data = report() if data is None else data
+    with open(fname, "wt", encoding="utf-8") as f:
+        json.dump(data, f, indent=1)
+    return data
@@ -1,40 +1,126 @@
-from fastkml import kml
-from geo import Point
-from shapely.geometry import Polygon
+from array import array
+from xml.parsers import expat
+
+from geo import TrackPath
 
 VERSION = '{http://www.opengis.net/kml/2.2}'
+CHUNK_SIZE = 64 * 1024
 
 
-def extract_track(k):
-    doc = list(k.features())[0]
-    track = list(doc.features())[0]
-    return track
+class TrackReader:
+    """
+    Incremental parser collecting the points of the first track of a KML or GPX document.
 
+    Supports KML `<coordinates>` (LineString, MultiGeometry...) and `<gx:coord>` (gx:Track), and GPX `<trkpt>`. Points
+    are appended to flat arrays as the document is read, so memory doesn't depend on the file size, and reading stops
+    as soon as `max_points` points are found.
+    """
+    TRACKS = ("Placemark", "trk")
 
-def read_kml(fname):
-    with open(fname, "rt", encoding="utf-8") as f:
-        doc = f.read().encode("utf-8")
-    k = kml.KML()
-    k.from_string(doc)
-    return k
+    def __init__(self, max_points=None):
+        self.max_points = max_points
+        self.lon = array("d")
+        self.lat = array("d")
+        self.alt = array("d")
+        self.name = None
+        self.done = False
+        self._tags = []
+        self._text = None
+        self._trkpt = None
+        self._parser = expat.ParserCreate(namespace_separator=" ")
+        self._parser.buffer_text = True
+        self._parser.StartElementHandler = self._start
+        self._parser.EndElementHandler = self._end
+        self._parser.CharacterDataHandler = self._data
+
+    def __len__(self):
+        return len(self.lon)
+
+    def _add(self, lon, lat, alt=float("nan")):
+        if self.done:
+            return
+        self.lon.append(lon)
+        self.lat.append(lat)
+        self.alt.append(alt)
+        if self.max_points is not None and len(self) >= self.max_points:
+            self.done = True
+
+    def _add_tuple(self, token):
+        values = token.split(",")
+        self._add(float(values[0]), float(values[1]), float(values[2]) if len(values) > 2 else float("nan"))
+
+    def _start(self, tag, attrs):
+        tag = tag.rsplit(" ", 1)[-1]
+        self._tags.append(tag)
+        if tag == "trkpt":
+            self._trkpt = [float(attrs["lon"]), float(attrs["lat"]), float("nan")]
+        if tag in ("coordinates", "coord", "ele", "name"):
+            self._text = ""
+
+    def _data(self, data):
+        if self._text is None:
+            return
+        if self._tags[-1] != "coordinates":
+            self._text += data
+            return
+        # Coordinates may be huge: parse complete tuples right away, keep the last (maybe partial) token
+        tokens = (self._text + data).split()
+        if tokens and not data[-1].isspace():
+            self._text = tokens.pop()
+        else:
+            self._text = ""
+        for token in tokens:
+            self._add_tuple(token)
+
+    def _end(self, tag):
+        tag = self._tags.pop()
+        text, self._text = self._text, None
+        if tag == "coordinates":
+            if text.strip():
+                self._add_tuple(text.strip())
+        elif tag == "coord":
+            values = [float(v) for v in text.split()]
+            self._add(*values[:3])
+        elif tag == "ele" and self._trkpt is not None:
+            self._trkpt[2] = float(text)
+        elif tag == "trkpt":
+            self._add(*self._trkpt)
+            self._trkpt = None
+        elif tag == "name" and self.name is None and self._tags and self._tags[-1] in self.TRACKS:
+            self.name = text.strip()
+        elif tag in self.TRACKS and len(self):
+            # Only read the first track
+            self.done = True
+
+    def feed(self, data, final=False):
+        self._parser.Parse(data, final)
+
+    def read(self, f, chunk_size=CHUNK_SIZE):
+        while not self.done:
+            data = f.read(chunk_size)
+            if not data:
+                self.feed(b"", True)
+                break
+            self.feed(data)
+        return self
+
+    @property
+    def path(self):
+        return TrackPath(self.lon, self.lat, alt=self.alt)
 
 
 def read_track(fname, max_points=None):
-    k = read_kml(fname)
-    track = extract_track(k)
-    name = track.name
-    points = []
-    for line in track.geometry.geoms:
-        for lon, lat, alt in line.coords:
-            points.append(Point(lon, lat))
-            if max_points is not None and len(points) == max_points:
-                return points, name
-    return points, name
+    """Read the points of the first track of a KML or GPX file, as a `geo.TrackPath`"""
+    with open(fname, "rb") as f:
+        reader = TrackReader(max_points).read(f)
+    return reader.path, reader.name
 
 def placemark(pid, name="", description=""):
+    from fastkml import kml
     return kml.Placemark(VERSION, str(pid), name, description)
 
 def rectangle(lon_min, lon_max, lat_min, lat_max):
+    from shapely.geometry import Polygon
     west, east, south, north = lon_min, lon_max, lat_min, lat_max
     path = [
         (west, north, 0),
@@ -45,6 +131,7 @@ def rectangle(lon_min, lon_max, lat_min, lat_max):
     return Polygon(path)
 
 def document(name='', description='', shapes=[]):
+    from fastkml import kml
     k = kml.KML()
 
     d = kml.Document(VERSION, 'root', 'Boxes', '')
@@ -1,18 +1,26 @@
-import matplotlib.pyplot as plt
+import io
 import math
 
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from PIL import Image
+
+# Padding (in inches) around the tight bounding box, as in `savefig(bbox_inches="tight")`
+TIGHT_PAD = 0.1
+
+# Figures reused across renders, by (size, dpi)
+_figures = {}
+
 def get_vlines(distance, elevation, z_min, step=5, lstyle="--", alpha=0.2):
-    ticks = []
-    weights = []
+    """Dashed lines every `step` km, from `z_min` up to the profile, interpolated at the exact distance"""
+    x_lines, max_lines = [], []
     for i in range(1, len(distance)):
-        if math.floor(distance[i - 1]) // step != math.floor(distance[i] // step):
-            ticks.append(i)
-            w = (i - distance[i - 1]) / (distance[i] - distance[i - 1])
-            weights.append(w)
-
-    x_lines = list(range(step, math.floor(distance[-1]), step))
-    min_lines = [z_min for _ in ticks]
-    max_lines = [(t * elevation[i] + (1 - t) * elevation[i - 1]) for i, t in zip(ticks, weights)]
+        for k in range(math.floor(distance[i - 1] / step) + 1, math.floor(distance[i] / step) + 1):
+            x = k * step
+            t = (x - distance[i - 1]) / (distance[i] - distance[i - 1])
+            x_lines.append(x)
+            max_lines.append(elevation[i - 1] + t * (elevation[i] - elevation[i - 1]))
+    min_lines = [z_min for _ in x_lines]
     return x_lines, min_lines, max_lines
 
 def set_axes(x, z, axes, max_diff):
@@ -33,4 +41,46 @@ def set_axes(x, z, axes, max_diff):
 def set_grid(axes):
     axes.grid(axis="y", linestyle="--", alpha=0.5)
     for side in ["top", "bottom", "right", "left"]:
-        axes.spines[side].set_visible(False)
\ No newline at end of file
+        axes.spines[side].set_visible(False)
+
+def get_figure(figsize, dpi):
+    """A cleared Agg figure of the given size, created once and reused, outside of pyplot's state machine"""
+    key = (tuple(figsize), dpi)
+    if key not in _figures:
+        fig = Figure(figsize=figsize, dpi=dpi)
+        FigureCanvasAgg(fig)
+        _figures[key] = fig
+    fig = _figures[key]
+    fig.clear()
+    return fig
+
+def render_profile(x, z, title, subtitle, size, dpi, max_diff=1000):
+    """Render an elevation profile with its title & subtitle, cropped to its tight bounding box, as an RGBA image"""
+    w_in = size[0] / dpi
+    h_in = size[1] / dpi
+    fig = get_figure((w_in, h_in), dpi)
+
+    # Set axes and grid
+    axes = fig.add_subplot(111)
+    z_min, z_max = set_axes(x, z, axes, max_diff)
+    set_grid(axes)
+
+    # Plot data
+    axes.plot(x, z)
+    axes.fill_between(x, z, z_min, alpha=0.2)
+    axes.vlines(*get_vlines(x, z, z_min))
+
+    # Add legend
+    # TODO : improve text display to avoid overlap or oversize
+    axes.text(0, 1, title, fontsize=12, fontweight="semibold", transform=axes.transAxes)
+    axes.text(0, 0.92, subtitle, fontsize=11, transform=axes.transAxes)
+
+    # Raw RGBA output: same layout as a tight PNG, without the encoding/decoding round trip
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format="raw", dpi=dpi, bbox_inches="tight", pad_inches=TIGHT_PAD, transparent=False,
+                edgecolor="k")
+    bbox = fig.get_tightbbox(fig.canvas.get_renderer()).padded(TIGHT_PAD)
+    data = buffer.getvalue()
+    width = int(bbox.width * dpi)
+    height = len(data) // (4 * width)
+    return Image.frombuffer("RGBA", (width, height), data, "raw", "RGBA", 0, 1)